@@ -4,8 +4,6 @@ from importlib.resources import files
 
 import soundfile as sf
 import tqdm
-from cached_path import cached_path
-from omegaconf import OmegaConf
 
 from f5_tts.infer.utils_infer import (
     load_model,
@@ -14,6 +12,7 @@ from f5_tts.infer.utils_infer import (
     preprocess_ref_audio_text,
     infer_process,
     remove_silence_for_generated_wav,
+    resolve_model_file,
     save_spectrogram,
 )
 from f5_tts.model import DiT, UNetT  # noqa: F401. used for config
@@ -31,7 +30,12 @@ class F5TTS:
         vocoder_local_path=None,
         device=None,
         hf_cache_dir=None,
+        quantize=None,  # None | "int8", dynamic quantization for cpu inference
+        backend="torch",  # "torch" | "onnxruntime", with ckpt_file the directory exported by scripts/export_onnx.py
+        dtype=None,  # None (auto) | "float32" | "float16" | "bfloat16", bfloat16 autocast e.g. for amx cpus
     ):
+        from omegaconf import OmegaConf
+
         model_cfg = OmegaConf.load(str(files("f5_tts").joinpath(f"configs/{model}.yaml")))
         model_cls = globals()[model_cfg.model.backbone]
         model_arc = model_cfg.model.arch
@@ -58,9 +62,21 @@ class F5TTS:
             )
 
         # Load models
-        self.vocoder = load_vocoder(
-            self.mel_spec_type, vocoder_local_path is not None, vocoder_local_path, self.device, hf_cache_dir
-        )
+        if backend == "onnxruntime":
+            from f5_tts.infer.utils_onnx import OnnxVocos
+
+            if not ckpt_file:
+                raise ValueError("ckpt_file should be the exported onnx directory for onnxruntime backend")
+            self.vocoder = OnnxVocos(ckpt_file, device=self.device)
+        else:
+            self.vocoder = load_vocoder(
+                self.mel_spec_type,
+                vocoder_local_path is not None,
+                vocoder_local_path,
+                self.device,
+                hf_cache_dir,
+                quantize=quantize,
+            )
 
         repo_name, ckpt_step, ckpt_type = "F5-TTS", 1250000, "safetensors"
 
@@ -76,11 +92,21 @@ class F5TTS:
             ckpt_step = 1200000
 
         if not ckpt_file:
-            ckpt_file = str(
-                cached_path(f"hf://SWivid/{repo_name}/{model}/model_{ckpt_step}.{ckpt_type}", cache_dir=hf_cache_dir)
+            ckpt_file = resolve_model_file(
+                f"hf://SWivid/{repo_name}/{model}/model_{ckpt_step}.{ckpt_type}", cache_dir=hf_cache_dir
             )
         self.ema_model = load_model(
-            model_cls, model_arc, ckpt_file, self.mel_spec_type, vocab_file, self.ode_method, self.use_ema, self.device
+            model_cls,
+            model_arc,
+            ckpt_file,
+            self.mel_spec_type,
+            vocab_file,
+            self.ode_method,
+            self.use_ema,
+            self.device,
+            quantize=quantize,
+            backend=backend,
+            dtype=dtype,
         )
 
     def transcribe(self, ref_audio, language=None):
@@ -106,7 +132,10 @@ class F5TTS:
         cross_fade_duration=0.15,
         sway_sampling_coef=-1,
         cfg_strength=2,
+        cfg_schedule=None,
+        cfg_skip_mode="reuse",
         nfe_step=32,
+        ode_method=None,
         speed=1.0,
         fix_duration=None,
         remove_silence=False,
@@ -133,7 +162,10 @@ class F5TTS:
             target_rms=target_rms,
             cross_fade_duration=cross_fade_duration,
             nfe_step=nfe_step,
+            ode_method=ode_method or self.ode_method,
             cfg_strength=cfg_strength,
+            cfg_schedule=cfg_schedule,
+            cfg_skip_mode=cfg_skip_mode,
             sway_sampling_coef=sway_sampling_coef,
             speed=speed,
             fix_duration=fix_duration,
@@ -9,7 +9,6 @@ from pathlib import Path
 import numpy as np
 import soundfile as sf
 import tomli
-from cached_path import cached_path
 from omegaconf import OmegaConf
 
 from f5_tts.infer.utils_infer import (
@@ -18,6 +17,8 @@ from f5_tts.infer.utils_infer import (
     cross_fade_duration,
     nfe_step,
     cfg_strength,
+    cfg_schedule,
+    cfg_skip_mode,
     sway_sampling_coef,
     speed,
     fix_duration,
@@ -26,6 +27,7 @@ from f5_tts.infer.utils_infer import (
     load_vocoder,
     preprocess_ref_audio_text,
     remove_silence_for_generated_wav,
+    resolve_model_file,
 )
 from f5_tts.model import DiT, UNetT  # noqa: F401. used for config
 
@@ -147,6 +149,17 @@ parser.add_argument(
     type=float,
     help=f"Classifier-free guidance strength, default {cfg_strength}",
 )
+parser.add_argument(
+    "--cfg_schedule",
+    type=str,
+    help=f"Steps to run the unconditional pass on: first:k | every:n, default {cfg_schedule} for every step",
+)
+parser.add_argument(
+    "--cfg_skip_mode",
+    type=str,
+    choices=["reuse", "none"],
+    help=f"Guidance on steps skipping the unconditional pass, reuse the last one or none, default {cfg_skip_mode}",
+)
 parser.add_argument(
     "--sway_sampling_coef",
     type=float,
@@ -198,7 +211,9 @@ vocoder_name = args.vocoder_name or config.get("vocoder_name", mel_spec_type)
 target_rms = args.target_rms or config.get("target_rms", target_rms)
 cross_fade_duration = args.cross_fade_duration or config.get("cross_fade_duration", cross_fade_duration)
 nfe_step = args.nfe_step or config.get("nfe_step", nfe_step)
-cfg_strength = args.cfg_strength or config.get("cfg_strength", cfg_strength)
+cfg_strength = args.cfg_strength or config.get("cfg_strength", cfg_strength)  # per-step list allowed in config
+cfg_schedule = args.cfg_schedule or config.get("cfg_schedule", cfg_schedule)
+cfg_skip_mode = args.cfg_skip_mode or config.get("cfg_skip_mode", cfg_skip_mode)
 sway_sampling_coef = args.sway_sampling_coef or config.get("sway_sampling_coef", sway_sampling_coef)
 speed = args.speed or config.get("speed", speed)
 fix_duration = args.fix_duration or config.get("fix_duration", fix_duration)
@@ -266,7 +281,7 @@ elif model == "E2TTS_Base":
     ckpt_step = 1200000
 
 if not ckpt_file:
-    ckpt_file = str(cached_path(f"hf://SWivid/{repo_name}/{model}/model_{ckpt_step}.{ckpt_type}"))
+    ckpt_file = resolve_model_file(f"hf://SWivid/{repo_name}/{model}/model_{ckpt_step}.{ckpt_type}")
 
 print(f"Using {model}...")
 ema_model = load_model(model_cls, model_cfg.arch, ckpt_file, mel_spec_type=vocoder_name, vocab_file=vocab_file)
@@ -322,6 +337,8 @@ def main():
             cross_fade_duration=cross_fade_duration,
             nfe_step=nfe_step,
             cfg_strength=cfg_strength,
+            cfg_schedule=cfg_schedule,
+            cfg_skip_mode=cfg_skip_mode,
             sway_sampling_coef=sway_sampling_coef,
             speed=speed,
             fix_duration=fix_duration,
@@ -12,7 +12,6 @@ import gradio as gr
 import numpy as np
 import soundfile as sf
 import torchaudio
-from cached_path import cached_path
 from transformers import AutoModelForCausalLM, AutoTokenizer
 
 try:
@@ -37,6 +36,7 @@ from f5_tts.infer.utils_infer import (
     preprocess_ref_audio_text,
     infer_process,
     remove_silence_for_generated_wav,
+    resolve_model_file,
     save_spectrogram,
 )
 
@@ -57,13 +57,13 @@ vocoder = load_vocoder()
 
 
 def load_f5tts():
-    ckpt_path = str(cached_path(DEFAULT_TTS_MODEL_CFG[0]))
+    ckpt_path = resolve_model_file(DEFAULT_TTS_MODEL_CFG[0])
     F5TTS_model_cfg = json.loads(DEFAULT_TTS_MODEL_CFG[2])
     return load_model(DiT, F5TTS_model_cfg, ckpt_path)
 
 
 def load_e2tts():
-    ckpt_path = str(cached_path("hf://SWivid/E2-TTS/E2TTS_Base/model_1200000.safetensors"))
+    ckpt_path = resolve_model_file("hf://SWivid/E2-TTS/E2TTS_Base/model_1200000.safetensors")
     E2TTS_model_cfg = dict(dim=1024, depth=24, heads=16, ff_mult=4, text_mask_padding=False, pe_attn_head=1)
     return load_model(UNetT, E2TTS_model_cfg, ckpt_path)
 
@@ -71,9 +71,9 @@ def load_e2tts():
 def load_custom(ckpt_path: str, vocab_path="", model_cfg=None):
     ckpt_path, vocab_path = ckpt_path.strip(), vocab_path.strip()
     if ckpt_path.startswith("hf://"):
-        ckpt_path = str(cached_path(ckpt_path))
+        ckpt_path = resolve_model_file(ckpt_path)
     if vocab_path.startswith("hf://"):
-        vocab_path = str(cached_path(vocab_path))
+        vocab_path = resolve_model_file(vocab_path)
     if model_cfg is None:
         model_cfg = json.loads(DEFAULT_TTS_MODEL_CFG[2])
     return load_model(DiT, model_cfg, ckpt_path, vocab_file=vocab_path)
@@ -907,8 +907,20 @@ If you're having issues, try converting your reference audio to WAV or MP3, clip
     default=False,
     help="Automatically launch the interface in the default web browser",
 )
-def main(port, host, share, api, root_path, inbrowser):
+@click.option(
+    "--compile",
+    "-c",
+    is_flag=True,
+    default=False,
+    help="Compile the default model with frame bucketing, and compile all buckets before launch",
+)
+@click.option("--compile_cache_dir", default=None, type=str, help="Directory to keep compile artifacts across starts")
+def main(port, host, share, api, root_path, inbrowser, compile, compile_cache_dir):
     global app
+    if compile:
+        print("Compiling model...")
+        F5TTS_ema_model.compile_transformer(cache_dir=compile_cache_dir)
+        F5TTS_ema_model.warm_up()
     print("Starting app...")
     app.queue(api_open=api).launch(
         server_name=host,
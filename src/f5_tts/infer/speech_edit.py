@@ -171,7 +171,7 @@ duration = audio.shape[-1] // hop_length
 
 # Inference
 with torch.inference_mode():
-    generated, trajectory = model.sample(
+    generated, _ = model.sample(
         cond=audio,
         text=final_text_list,
         duration=duration,
@@ -0,0 +1,350 @@
+# cross-request dynamic batching for serving: text chunks of different streams (each with its own reference voice)
+# are collected for a short window, then run as one batched sample call, and the audio routed back per chunk.
+# ContinuousBatchScheduler goes further, admitting and retiring requests between ode steps
+
+import threading
+import time
+from collections import deque
+
+import torch
+import torch.nn.functional as F
+
+from f5_tts.infer.utils_infer import decode_mels, infer_batch_sample, target_rms
+from f5_tts.model.utils import list_str_to_idx, list_str_to_tensor
+
+
+class BatchRequest:
+    def __init__(
+        self,
+        ref_mel,  # reference mel, n d
+        ref_audio_len,  # frames of the reference, cut from the generated mel
+        ref_rms,  # original loudness of the reference, restored on the output
+        final_text,  # reference + generation text, already converted to model tokens
+        duration,  # total frames, reference included
+        key=None,  # requests of the same key (e.g. one stream) never share a batch, so they finish in order
+        callback=None,  # called on the scheduler thread with the wave (numpy) or the exception
+    ):
+        self.ref_mel = ref_mel
+        self.ref_audio_len = ref_audio_len
+        self.ref_rms = ref_rms
+        self.final_text = final_text
+        self.duration = duration
+        self.key = key
+        self.callback = callback
+
+
+class BatchScheduler:
+    def __init__(
+        self,
+        model_obj,
+        vocoder,
+        mel_spec_type="vocos",
+        batch_window=0.02,  # seconds to wait for more requests once the first one is pending
+        batch_frame_budget=16384,  # max padded frames per batched sample call
+        max_batch_size=16,
+        workspace=None,  # SampleWorkspace, only used from the scheduler thread
+        **sample_kwargs,  # nfe_step, cfg_strength, sway_sampling_coef, ..., see infer_batch_sample()
+    ):
+        self.model_obj = model_obj
+        self.vocoder = vocoder
+        self.mel_spec_type = mel_spec_type
+        self.batch_window = batch_window
+        self.batch_frame_budget = batch_frame_budget
+        batch_buckets = getattr(model_obj, "batch_buckets", None)
+        if batch_buckets:  # a compiled model only takes the batch sizes it was compiled for
+            max_batch_size = min(max_batch_size, batch_buckets[-1])
+        self.max_batch_size = max_batch_size
+        self.workspace = workspace
+        self.sample_kwargs = sample_kwargs
+
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, name="tts-batch-scheduler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.thread.join()
+
+    def submit(self, request: BatchRequest):
+        with self.condition:
+            self.pending.append(request)
+            self.condition.notify()
+
+    def cancel(self, key):
+        # drop pending requests of a key, e.g. the client went away. a running batch still completes
+        with self.condition:
+            self.pending = deque(request for request in self.pending if request.key != key)
+
+    def select(self):
+        # oldest request of each key, in arrival order, while the padded frames fit the budget
+        batch, keys, max_duration = [], set(), 0
+        for request in self.pending:
+            if request.key is not None and request.key in keys:
+                continue
+            if batch and (len(batch) + 1) * max(max_duration, request.duration) > self.batch_frame_budget:
+                return batch, True
+            batch.append(request)
+            keys.add(request.key)
+            max_duration = max(max_duration, request.duration)
+            if len(batch) == self.max_batch_size:
+                return batch, True
+        return batch, False
+
+    def next_batch(self):
+        with self.condition:
+            while not self.pending and not self.stopped:
+                self.condition.wait()
+            if self.stopped:
+                return []
+            deadline = time.monotonic() + self.batch_window
+            while True:
+                batch, full = self.select()
+                remaining = deadline - time.monotonic()
+                if full or remaining <= 0 or self.stopped:
+                    break
+                self.condition.wait(remaining)
+            selected = set(map(id, batch))
+            self.pending = deque(request for request in self.pending if id(request) not in selected)
+            return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            if not batch:
+                break
+            try:
+                outputs = infer_batch_sample(
+                    self.model_obj,
+                    self.vocoder,
+                    [request.ref_mel for request in batch],
+                    [request.ref_audio_len for request in batch],
+                    [request.final_text for request in batch],
+                    [request.duration for request in batch],
+                    mel_spec_type=self.mel_spec_type,
+                    workspace=self.workspace,
+                    **self.sample_kwargs,
+                )
+            except Exception as e:
+                for request in batch:
+                    request.callback(e)
+                continue
+            for request, (generated_wave, _) in zip(batch, outputs):
+                if request.ref_rms < target_rms:
+                    generated_wave = generated_wave * (request.ref_rms / target_rms)
+                request.callback(generated_wave)
+
+
+# step-level continuous batching
+# every live sequence sits at its own euler step, one transformer forward per tick over all of them (per-item time),
+# newcomers admitted at any tick and finished ones retired (vocoded and routed back) right away
+
+
+class LiveSequence:
+    def __init__(self, request, x, step_cond, cond_mask, cond_embed, uncond_embed):
+        self.request = request
+        self.x = x  # ode state, n d
+        self.step_cond = step_cond  # reference mel zero padded to the total frames, n d
+        self.cond_mask = cond_mask  # n
+        self.cond_embed, self.uncond_embed = cond_embed, uncond_embed  # step-invariant input projection, n d'
+        self.step = 0
+
+
+class ContinuousBatchScheduler(BatchScheduler):
+    def __init__(
+        self,
+        model_obj,
+        vocoder,
+        mel_spec_type="vocos",
+        batch_frame_budget=16384,  # max padded frames over all live sequences
+        max_batch_size=16,
+        nfe_step=32,
+        cfg_strength=2.0,
+        sway_sampling_coef=-1,
+        max_duration=4096,
+        seed=None,  # same noise as CFM.sample with this seed, whatever a request is batched with
+    ):
+        transformer = model_obj.transformer
+        if not hasattr(transformer, "input_embed") or not hasattr(transformer, "forward_from_embed"):
+            raise ValueError(
+                f"Continuous batching is only supported for DiT backbone, got {type(transformer).__name__}"
+            )
+        if model_obj.batch_buckets is not None:
+            # input_embed & forward_from_embed are called directly, the compiled transformer forward is never used
+            raise ValueError("Continuous batching does not run the compiled transformer, load the model uncompiled")
+        super().__init__(
+            model_obj, vocoder, mel_spec_type, batch_frame_budget=batch_frame_budget, max_batch_size=max_batch_size
+        )
+        self.nfe_step = nfe_step
+        self.cfg_strength = cfg_strength
+        self.max_duration = max_duration
+        self.seed = seed
+        self.live = []  # only touched by the scheduler thread
+        self.packed = None  # padded batch of the live set, see pack()
+        self.cancelled = set()
+
+        # one shared euler time grid, its time conditioning computed once and looked up per item at each tick
+        device = model_obj.device
+        t = torch.linspace(0, 1, nfe_step + 1, device=device, dtype=next(model_obj.parameters()).dtype)
+        if sway_sampling_coef is not None:
+            t = t + sway_sampling_coef * (torch.cos(torch.pi / 2 * t) - 1 + t)
+        self.t = t
+        with torch.inference_mode(), self.model_obj.autocast():
+            self.time_cond = transformer.precompute_time_cond(t[:-1])
+
+    def cancel(self, key):
+        # pending requests dropped here, live ones at the next tick
+        with self.condition:
+            self.pending = deque(request for request in self.pending if request.key != key)
+            self.cancelled.add(key)
+
+    def admit(self):
+        # pending requests that fit next to the live ones, one per key so a stream's chunks finish in order
+        with self.condition:
+            while not self.pending and not self.live and not self.stopped:
+                self.condition.wait()
+            if self.cancelled:
+                live = [seq for seq in self.live if seq.request.key not in self.cancelled]
+                if len(live) != len(self.live):
+                    self.live, self.packed = live, None
+                self.cancelled.clear()
+            keys = {seq.request.key for seq in self.live}
+            max_frames = max((seq.x.shape[0] for seq in self.live), default=0)
+            admitted = []
+            for request in self.pending:
+                if len(self.live) + len(admitted) == self.max_batch_size:
+                    break
+                if request.key is not None and request.key in keys:
+                    continue
+                frames = self.get_frames(request)
+                if (len(self.live) + len(admitted) + 1) * max(max_frames, frames) > self.batch_frame_budget:
+                    if self.live or admitted:
+                        break
+                admitted.append(request)
+                keys.add(request.key)
+                max_frames = max(max_frames, frames)
+            admitted_ids = set(map(id, admitted))
+            self.pending = deque(request for request in self.pending if id(request) not in admitted_ids)
+        return admitted
+
+    def get_frames(self, request):
+        # total frames as clamped in CFM.sample
+        return min(max(max(len(request.final_text), request.ref_mel.shape[0]) + 1, request.duration), self.max_duration)
+
+    def prepare(self, request):
+        model = self.model_obj
+        transformer = model.transformer
+        device, dtype = model.device, next(model.parameters()).dtype
+        frames, ref_len = self.get_frames(request), request.ref_mel.shape[0]
+
+        if model.vocab_char_map is not None:
+            text = list_str_to_idx([request.final_text], model.vocab_char_map).to(device)
+        else:
+            text = list_str_to_tensor([request.final_text]).to(device)
+        step_cond = F.pad(request.ref_mel.to(device, dtype), (0, 0, 0, frames - ref_len)).unsqueeze(0)
+        cond_mask = torch.arange(frames, device=device) < ref_len
+        with self.model_obj.autocast():
+            text_embed = transformer.text_embed(text, frames, drop_text=False)
+            cond_embed = transformer.input_embed.embed_cond(step_cond, text_embed, drop_audio_cond=False)
+            text_embed = transformer.text_embed(text, frames, drop_text=True)
+            uncond_embed = transformer.input_embed.embed_cond(step_cond, text_embed, drop_audio_cond=True)
+        if self.seed is not None:
+            torch.manual_seed(self.seed)
+        x = torch.randn(frames, model.num_channels, device=device, dtype=dtype)
+        return LiveSequence(request, x, step_cond[0], cond_mask, cond_embed[0], uncond_embed[0])
+
+    def pack(self):
+        # padded batch of the live set, rebuilt only when it changes. sequence states become views into it
+        max_frames = max(seq.x.shape[0] for seq in self.live)
+
+        def pad(tensors, value=0):
+            return torch.stack(
+                [F.pad(x, (0, 0) * (x.ndim - 1) + (0, max_frames - x.shape[0]), value=value) for x in tensors]
+            )
+
+        x = pad([seq.x for seq in self.live])
+        for i, seq in enumerate(self.live):
+            seq.x = x[i, : seq.x.shape[0]]
+        mask = pad([torch.ones_like(seq.cond_mask) for seq in self.live], value=False)
+        cond_embed = pad([seq.cond_embed for seq in self.live])
+        uncond_embed = pad([seq.uncond_embed for seq in self.live])
+        steps = torch.tensor([seq.step for seq in self.live], device=x.device)
+        return x, mask, cond_embed, uncond_embed, steps
+
+    def tick(self, x, mask, cond_embed, uncond_embed, steps):
+        transformer = self.model_obj.transformer
+        time = self.t[steps]
+        dt = self.t[steps + 1] - time
+        t, t_mod_final, *t_mods = self.time_cond.lookup(time)
+
+        with self.model_obj.autocast():
+            if self.cfg_strength < 1e-5:
+                x_embed = transformer.input_embed(x, None, None, cond_embed=cond_embed, audio_mask=mask)
+                pred = transformer.forward_from_embed(x_embed, t, t_mod_final, t_mods, mask=mask).to(x.dtype)
+            else:  # packed cond & uncond forward: b n d -> 2b n d
+                x_embed = torch.cat(
+                    (
+                        transformer.input_embed(x, None, None, cond_embed=cond_embed, audio_mask=mask),
+                        transformer.input_embed(x, None, None, cond_embed=uncond_embed, audio_mask=mask),
+                    ),
+                    dim=0,
+                )
+                pred_cfg = transformer.forward_from_embed(
+                    x_embed,
+                    torch.cat((t, t), dim=0),
+                    torch.cat((t_mod_final, t_mod_final), dim=0),
+                    [torch.cat((t_mod, t_mod), dim=0) for t_mod in t_mods],
+                    mask=torch.cat((mask, mask), dim=0),
+                )
+                pred, null_pred = torch.chunk(pred_cfg.to(x.dtype), 2, dim=0)
+                pred = pred + (pred - null_pred) * self.cfg_strength
+
+        # euler step in place, so the sequences' views follow. padding kept at zero, it is masked anyway
+        x.addcmul_(pred, dt[:, None, None])
+        x.masked_fill_(~mask.unsqueeze(-1), 0.0)
+        steps += 1
+
+    def retire(self, finished):
+        mels = [
+            torch.where(seq.cond_mask.unsqueeze(-1), seq.step_cond, seq.x)[seq.request.ref_audio_len :].float()
+            for seq in finished
+        ]
+        outputs = decode_mels(self.vocoder, mels, self.mel_spec_type)
+        for seq, (generated_wave, _) in zip(finished, outputs):
+            if seq.request.ref_rms < target_rms:
+                generated_wave = generated_wave * (seq.request.ref_rms / target_rms)
+            seq.request.callback(generated_wave)
+
+    def run(self):
+        while True:
+            admitted = self.admit()
+            if self.stopped:
+                break
+            try:
+                with torch.inference_mode():
+                    for request in admitted:
+                        self.live.append(self.prepare(request))
+                        self.packed = None
+                    if not self.live:
+                        continue
+                    if self.packed is None:
+                        self.packed = self.pack()
+
+                    self.tick(*self.packed)
+                    for seq in self.live:
+                        seq.step += 1
+                    finished = [seq for seq in self.live if seq.step == self.nfe_step]
+                    if finished:
+                        self.live, self.packed = [seq for seq in self.live if seq.step < self.nfe_step], None
+                        self.retire(finished)
+            except Exception as e:
+                failed = {id(request): request for request in admitted + [seq.request for seq in self.live]}
+                for request in failed.values():
+                    request.callback(e)
+                self.live, self.packed = [], None
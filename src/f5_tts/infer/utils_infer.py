@@ -1,33 +1,30 @@
 # A unified script for inference process
 # Make adjustments inside functions, and consider both gradio and cli scripts if need to change func output format
+# Heavy optional dependencies (asr, plotting, audio editing, vocoders, hub) are imported on first use, keep it fast
+# to import for headless servers and per-utterance cli calls, see scripts/benchmark_import_time.py
 import os
 import sys
-from concurrent.futures import ThreadPoolExecutor
 
 os.environ["PYTORCH_ENABLE_MPS_FALLBACK"] = "1"  # for MPS device compatibility
-sys.path.append(f"{os.path.dirname(os.path.abspath(__file__))}/../../third_party/BigVGAN/")
 
 import hashlib
+import inspect
+import io
+import json
 import re
+import struct
 import tempfile
 from importlib.resources import files
 
-import matplotlib
-
-matplotlib.use("Agg")
-
-import matplotlib.pylab as plt
 import numpy as np
 import torch
 import torchaudio
 import tqdm
-from huggingface_hub import snapshot_download, hf_hub_download
-from pydub import AudioSegment, silence
-from transformers import pipeline
-from vocos import Vocos
+from torch.nn.utils.rnn import pad_sequence
 
-from f5_tts.model import CFM
+from f5_tts.model import CFM, DiT, MMDiT, UNetT
 from f5_tts.model.utils import (
+    default,
     get_tokenizer,
     convert_char_to_pinyin,
 )
@@ -57,6 +54,8 @@ cross_fade_duration = 0.15
 ode_method = "euler"
 nfe_step = 32  # 16, 32
 cfg_strength = 2.0
+cfg_schedule = None  # None | "first:k" | "every:n", steps to run the unconditional pass on
+cfg_skip_mode = "reuse"  # reuse | none, guidance on steps skipping the unconditional pass
 sway_sampling_coef = -1.0
 speed = 1.0
 fix_duration = None
@@ -64,9 +63,84 @@ fix_duration = None
 # -----------------------------------------
 
 
+# local model registry, a json manifest mapping remote uris to local files, e.g.
+# {"hf://SWivid/F5-TTS/F5TTS_v1_Base/model_1250000.safetensors": {"path": "...", "size": ..., "sha256": "..."}}
+# consulted before any hub lookup, so no network io at load time for registered files.
+# a file's sha256 is checked on its first lookup in a process, and again only if its size or mtime changes
+# see scripts/build_model_registry.py, path from $F5TTS_MODEL_REGISTRY or ckpts/registry.json
+
+MODEL_REGISTRY_ENV = "F5TTS_MODEL_REGISTRY"
+_model_registry = None
+_verified_files = set()  # (path, size, mtime) whose sha256 matched
+
+
+def get_model_registry_path():
+    return os.environ.get(MODEL_REGISTRY_ENV, str(files("f5_tts").joinpath("../../ckpts/registry.json")))
+
+
+def load_model_registry(registry_path=None):
+    registry_path = registry_path or get_model_registry_path()
+    if not os.path.isfile(registry_path):
+        return {}
+    with open(registry_path, "r", encoding="utf-8") as f:
+        registry = json.load(f)
+    registry_dir = os.path.dirname(os.path.abspath(registry_path))
+    for entry in registry.values():  # relative to the manifest
+        entry["path"] = os.path.join(registry_dir, os.path.expanduser(entry["path"]))
+    return registry
+
+
+def sha256sum(path, block_size=2**24):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def lookup_model_registry(uri):
+    global _model_registry
+    if _model_registry is None:
+        _model_registry = load_model_registry()
+    entry = _model_registry.get(uri)
+    if entry is None:
+        return None
+    path = entry["path"]
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} registered for {uri} does not exist")
+    if os.path.isdir(path):  # whole repo snapshot, no manifest hash
+        return path
+    stat = os.stat(path)
+    if "size" in entry and stat.st_size != entry["size"]:
+        raise ValueError(f"{path} registered for {uri} has size {stat.st_size}, expected {entry['size']}")
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    if "sha256" in entry and key not in _verified_files:
+        if sha256sum(path) != entry["sha256"]:
+            raise ValueError(f"{path} registered for {uri} does not match its sha256, rebuild the registry")
+        _verified_files.add(key)
+    return path
+
+
+def resolve_model_file(uri, cache_dir=None):
+    # registry first, then the hub, cached_path sends a request even when the file is already cached
+    path = lookup_model_registry(uri)
+    if path is not None:
+        return path
+    if not uri.startswith("hf://"):  # local file
+        return uri
+    from cached_path import cached_path
+
+    return str(cached_path(uri, cache_dir=cache_dir))
+
+
 # chunk text into smaller pieces
 
 
+# split into sentences based on punctuation followed by whitespace
+sentence_split_pattern = re.compile(r"(?<=[;:,.!?])\s+|(?<=[；：，。！？])")
+sentence_end_chars = ".!?。！？"
+
+
 def chunk_text(text, max_chars=135):
     """
     Splits the input text into chunks, each with a maximum number of characters.
@@ -81,7 +155,7 @@ def chunk_text(text, max_chars=135):
     chunks = []
     current_chunk = ""
     # Split the text into sentences based on punctuation followed by whitespace
-    sentences = re.split(r"(?<=[;:,.!?])\s+|(?<=[；：，。！？])", text)
+    sentences = sentence_split_pattern.split(text)
 
     for sentence in sentences:
         if len(current_chunk.encode("utf-8")) + len(sentence.encode("utf-8")) <= max_chars:
@@ -97,19 +171,94 @@ def chunk_text(text, max_chars=135):
     return chunks
 
 
+class TextChunker:
+    """
+    Incremental chunk_text, for text arriving in fragments, e.g. tokens streamed from a language model.
+
+    A chunk is released as soon as a sentence is complete, or the completed clauses reach min_chars bytes
+    (first_chars for the first chunk, smaller for a fast first audio). Text without any punctuation is cut at a
+    space once it exceeds max_chars.
+
+    Args:
+        max_chars (int): The maximum number of characters per chunk.
+        min_chars (int): Bytes of completed clauses that are released without waiting for the sentence end.
+        first_chars (int): min_chars for the first chunk, default min_chars.
+    """
+
+    def __init__(self, max_chars=135, min_chars=0, first_chars=None):
+        self.max_chars = max_chars
+        self.min_chars = min_chars
+        self.first_chars = default(first_chars, min_chars)
+        self.pending = ""  # completed clauses, not released yet
+        self.tail = ""  # text after the last boundary, may still grow
+        self.released = False
+
+    def push(self, fragment):
+        """Adds a fragment, returns the chunks ready for synthesis."""
+        sentences = sentence_split_pattern.split(self.tail + fragment)
+        self.tail = sentences.pop()
+        for sentence in sentences:
+            self.pending += sentence + " " if sentence and len(sentence[-1].encode("utf-8")) == 1 else sentence
+
+        if len(self.tail.encode("utf-8")) > self.max_chars:  # no boundary in sight, cut at the last space
+            head, _, tail = self.tail.rpartition(" ")
+            if head:
+                self.pending, self.tail = self.pending + head + " ", tail
+                return self.release()
+
+        pending = self.pending.strip()
+        min_chars = self.min_chars if self.released else self.first_chars
+        if pending and (pending[-1] in sentence_end_chars or len(pending.encode("utf-8")) >= min_chars):
+            return self.release()
+        return []
+
+    def flush(self):
+        """Returns the chunks of all remaining text, at the end of the stream."""
+        self.pending, self.tail = self.pending + self.tail, ""
+        return self.release()
+
+    def release(self):
+        chunks = chunk_text(self.pending, max_chars=self.max_chars)
+        self.pending = ""
+        self.released = self.released or bool(chunks)
+        return chunks
+
+
+# int8 dynamic quantization, weights stored in int8 and activations quantized on the fly, cpu only
+
+
+def quantize_int8(module):
+    return torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def check_quantize(quantize, device):
+    if quantize not in [None, "int8"]:
+        raise ValueError(f"Unsupported quantize: {quantize}, choose from None, 'int8'")
+    if quantize == "int8" and torch.device(device).type != "cpu":
+        raise ValueError("int8 dynamic quantization is only supported on cpu")
+
+
 # load vocoder
-def load_vocoder(vocoder_name="vocos", is_local=False, local_path="", device=device, hf_cache_dir=None):
+def load_vocoder(vocoder_name="vocos", is_local=False, local_path="", device=device, hf_cache_dir=None, quantize=None):
+    check_quantize(quantize, device)
     if vocoder_name == "vocos":
+        from vocos import Vocos
+
         # vocoder = Vocos.from_pretrained("charactr/vocos-mel-24khz").to(device)
         if is_local:
             print(f"Load vocos from local path {local_path}")
             config_path = f"{local_path}/config.yaml"
             model_path = f"{local_path}/pytorch_model.bin"
         else:
-            print("Download Vocos from huggingface charactr/vocos-mel-24khz")
             repo_id = "charactr/vocos-mel-24khz"
-            config_path = hf_hub_download(repo_id=repo_id, cache_dir=hf_cache_dir, filename="config.yaml")
-            model_path = hf_hub_download(repo_id=repo_id, cache_dir=hf_cache_dir, filename="pytorch_model.bin")
+            config_path = lookup_model_registry(f"hf://{repo_id}/config.yaml")
+            model_path = lookup_model_registry(f"hf://{repo_id}/pytorch_model.bin")
+            if config_path is None or model_path is None:
+                from huggingface_hub import hf_hub_download
+
+                print("Download Vocos from huggingface charactr/vocos-mel-24khz")
+                config_path = hf_hub_download(repo_id=repo_id, cache_dir=hf_cache_dir, filename="config.yaml")
+                model_path = hf_hub_download(repo_id=repo_id, cache_dir=hf_cache_dir, filename="pytorch_model.bin")
         vocoder = Vocos.from_hparams(config_path)
         state_dict = torch.load(model_path, map_location="cpu", weights_only=True)
         from vocos.feature_extractors import EncodecFeatures
@@ -122,7 +271,12 @@ def load_vocoder(vocoder_name="vocos", is_local=False, local_path="", device=dev
             state_dict.update(encodec_parameters)
         vocoder.load_state_dict(state_dict)
         vocoder = vocoder.eval().to(device)
+        if quantize == "int8":  # convnext blocks' pointwise linears dominate
+            vocoder.backbone = quantize_int8(vocoder.backbone)
     elif vocoder_name == "bigvgan":
+        bigvgan_path = f"{os.path.dirname(os.path.abspath(__file__))}/../../third_party/BigVGAN/"
+        if bigvgan_path not in sys.path:
+            sys.path.append(bigvgan_path)
         try:
             from third_party.BigVGAN import bigvgan
         except ImportError:
@@ -131,9 +285,16 @@ def load_vocoder(vocoder_name="vocos", is_local=False, local_path="", device=dev
             """download from https://huggingface.co/nvidia/bigvgan_v2_24khz_100band_256x/tree/main"""
             vocoder = bigvgan.BigVGAN.from_pretrained(local_path, use_cuda_kernel=False)
         else:
-            local_path = snapshot_download(repo_id="nvidia/bigvgan_v2_24khz_100band_256x", cache_dir=hf_cache_dir)
+            repo_id = "nvidia/bigvgan_v2_24khz_100band_256x"
+            local_path = lookup_model_registry(f"hf://{repo_id}")  # whole repo snapshot, a directory
+            if local_path is None:
+                from huggingface_hub import snapshot_download
+
+                local_path = snapshot_download(repo_id=repo_id, cache_dir=hf_cache_dir)
             vocoder = bigvgan.BigVGAN.from_pretrained(local_path, use_cuda_kernel=False)
 
+        if quantize is not None:
+            raise ValueError("BigVGAN is fully convolutional, quantize is only supported for vocos")
         vocoder.remove_weight_norm()
         vocoder = vocoder.eval().to(device)
     return vocoder
@@ -145,6 +306,8 @@ asr_pipe = None
 
 
 def initialize_asr_pipeline(device: str = device, dtype=None):
+    from transformers import pipeline
+
     if dtype is None:
         dtype = (
             torch.float16
@@ -153,10 +316,11 @@ def initialize_asr_pipeline(device: str = device, dtype=None):
             and not torch.cuda.get_device_name().endswith("[ZLUDA]")
             else torch.float32
         )
+    repo_id = "openai/whisper-large-v3-turbo"
     global asr_pipe
     asr_pipe = pipeline(
         "automatic-speech-recognition",
-        model="openai/whisper-large-v3-turbo",
+        model=lookup_model_registry(f"hf://{repo_id}") or repo_id,  # whole repo snapshot, a directory
         torch_dtype=dtype,
         device=device,
     )
@@ -181,7 +345,10 @@ def transcribe(ref_audio, language=None):
 # load model checkpoint for inference
 
 
-def load_checkpoint(model, ckpt_path, device: str, dtype=None, use_ema=True):
+def load_checkpoint(model, ckpt_path, device: str, dtype=None, use_ema=True, quantize=None):
+    check_quantize(quantize, device)
+    if quantize is not None:
+        dtype = torch.float32  # quantize from full precision weights
     if dtype is None:
         dtype = (
             torch.float16
@@ -223,7 +390,17 @@ def load_checkpoint(model, ckpt_path, device: str, dtype=None, use_ema=True):
     del checkpoint
     torch.cuda.empty_cache()
 
-    return model.to(device)
+    model = model.to(device)
+    if quantize == "int8":
+        # the linears of the transformer blocks (attention, feedforward, adaln), which dominate cpu time
+        # input embedding left as is, its projection weight is sliced for the cached cond path
+        backbone = model.transformer
+        if hasattr(backbone, "transformer_blocks"):  # dit, mmdit
+            backbone.transformer_blocks = quantize_int8(backbone.transformer_blocks)
+        else:  # unett
+            backbone.layers = quantize_int8(backbone.layers)
+
+    return model
 
 
 # load model for inference
@@ -238,7 +415,27 @@ def load_model(
     ode_method=ode_method,
     use_ema=True,
     device=device,
+    quantize=None,  # None | "int8", see load_checkpoint()
+    backend="torch",  # "torch" | "onnxruntime", for onnxruntime ckpt_path is the directory from export_onnx()
+    dtype=None,  # None (auto) | "float32" | "float16" | "bfloat16", bfloat16 is autocast over fp32 weights
 ):
+    if backend not in ["torch", "onnxruntime"]:
+        raise ValueError(f"Unsupported backend: {backend}, choose from 'torch', 'onnxruntime'")
+    if backend == "onnxruntime" and (quantize is not None or dtype is not None):
+        raise ValueError("quantize and dtype are only supported for the torch backend")
+    if isinstance(dtype, str):
+        if dtype not in ["float32", "float16", "bfloat16"]:
+            raise ValueError(f"Unsupported dtype: {dtype}, choose from 'float32', 'float16', 'bfloat16'")
+        dtype = getattr(torch, dtype)
+    autocast_dtype = None
+    if dtype == torch.bfloat16:
+        # weights stay fp32, matmuls run in bf16 under autocast (amx / avx512-bf16 cpus),
+        # mel front end, time embedding and ode state in fp32, see CFM.sample()
+        if quantize is not None:
+            raise ValueError("bfloat16 autocast can not be combined with quantize")
+        dtype, autocast_dtype = torch.float32, torch.bfloat16
+    elif dtype is None and mel_spec_type == "bigvgan":
+        dtype = torch.float32
     if vocab_file == "":
         vocab_file = str(files("f5_tts").joinpath("infer/examples/vocab.txt"))
     tokenizer = "custom"
@@ -248,8 +445,14 @@ def load_model(
     print("model : ", ckpt_path, "\n")
 
     vocab_char_map, vocab_size = get_tokenizer(vocab_file, tokenizer)
+    if backend == "onnxruntime":
+        from f5_tts.infer.utils_onnx import OnnxDiT
+
+        transformer = OnnxDiT(ckpt_path, device=device)
+    else:
+        transformer = model_cls(**model_cfg, text_num_embeds=vocab_size, mel_dim=n_mel_channels)
     model = CFM(
-        transformer=model_cls(**model_cfg, text_num_embeds=vocab_size, mel_dim=n_mel_channels),
+        transformer=transformer,
         mel_spec_kwargs=dict(
             n_fft=n_fft,
             hop_length=hop_length,
@@ -264,13 +467,146 @@ def load_model(
         vocab_char_map=vocab_char_map,
     ).to(device)
 
-    dtype = torch.float32 if mel_spec_type == "bigvgan" else None
-    model = load_checkpoint(model, ckpt_path, device, dtype=dtype, use_ema=use_ema)
+    if backend == "onnxruntime":  # weights are in the onnx graphs
+        return model.eval()
+
+    model = load_checkpoint(model, ckpt_path, device, dtype=dtype, use_ema=use_ema, quantize=quantize)
+    model.autocast_dtype = autocast_dtype
 
     return model
 
 
+# deployment bundle, a single inference-only safetensors file with model & vocoder weights (renamed and cast already),
+# vocab and configs in its metadata. loaded by memory-mapping, so workers share the weights copy-on-write
+
+
+def save_bundle(
+    bundle_path,
+    model,
+    vocoder,
+    backbone: str,  # DiT | UNetT | MMDiT
+    model_cfg: dict,
+    vocab_file,
+    vocoder_config_path,  # vocos config.yaml
+    dtype=None,  # cast model weights to, default to current dtype
+):
+    from safetensors.torch import save_file
+    from vocos import Vocos
+
+    if not isinstance(vocoder, Vocos):
+        raise ValueError("Bundle only supports vocos vocoder")
+    dtype = dtype or next(model.parameters()).dtype
+    tensors = {f"model.{k}": v.to(dtype) if v.is_floating_point() else v for k, v in model.state_dict().items()}
+    tensors.update({f"vocoder.{k}": v.float() for k, v in vocoder.state_dict().items()})  # vocoder stays fp32
+    tensors = {k: v.detach().cpu().contiguous() for k, v in tensors.items()}
+    with open(vocab_file, "r", encoding="utf-8") as f:
+        vocab = f.read()
+    with open(vocoder_config_path, "r", encoding="utf-8") as f:
+        vocoder_config = f.read()
+    metadata = dict(
+        backbone=backbone,
+        model_cfg=json.dumps(model_cfg),
+        mel_spec=json.dumps(
+            dict(
+                n_fft=n_fft,
+                hop_length=hop_length,
+                win_length=win_length,
+                n_mel_channels=n_mel_channels,
+                target_sample_rate=target_sample_rate,
+                mel_spec_type="vocos",
+            )
+        ),
+        vocab=vocab,
+        vocoder_config=vocoder_config,
+    )
+    save_file(tensors, bundle_path, metadata=metadata)
+
+
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def mmap_safetensors(path):
+    # tensors viewing a private (copy-on-write) mapping of the file, pages are read on first touch and shared
+    # with every other process mapping the same file, nothing is copied as long as weights are not written
+    with open(path, "rb") as f:
+        (header_len,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_len))
+    metadata = header.pop("__metadata__", {})
+    data_start = 8 + header_len
+
+    storage = torch.UntypedStorage.from_file(path, shared=False, nbytes=os.path.getsize(path))
+    buffer = torch.empty(0, dtype=torch.uint8).set_(storage)
+    tensors = {}
+    for name, info in header.items():
+        dtype = SAFETENSORS_DTYPES[info["dtype"]]
+        begin, end = (data_start + offset for offset in info["data_offsets"])
+        tensor = buffer[begin:end]
+        if begin % torch.empty(0, dtype=dtype).element_size() != 0:  # unaligned, needs a copy
+            tensor = tensor.clone()
+        tensors[name] = tensor.view(dtype).view(info["shape"])
+    return tensors, metadata
+
+
+def load_state_dict_mapped(module, state_dict):
+    # assign (torch>=2.1), so parameters are the mapped tensors instead of copies into freshly allocated ones
+    if "assign" in inspect.signature(module.load_state_dict).parameters:
+        module.load_state_dict(state_dict, assign=True)
+    else:
+        module.load_state_dict(state_dict)
+
+
+def load_bundle(bundle_path, ode_method=ode_method, device=device):
+    from vocos import Vocos
+
+    tensors, metadata = mmap_safetensors(bundle_path)
+
+    vocab_char_map = {}
+    for i, char in enumerate(io.StringIO(metadata["vocab"])):
+        vocab_char_map[char[:-1]] = i
+    model_cls = dict(DiT=DiT, UNetT=UNetT, MMDiT=MMDiT)[metadata["backbone"]]
+    model = CFM(
+        transformer=model_cls(
+            **json.loads(metadata["model_cfg"]), text_num_embeds=len(vocab_char_map), mel_dim=n_mel_channels
+        ),
+        mel_spec_kwargs=json.loads(metadata["mel_spec"]),
+        odeint_kwargs=dict(
+            method=ode_method,
+        ),
+        vocab_char_map=vocab_char_map,
+    )
+    load_state_dict_mapped(model, {k[len("model.") :]: v for k, v in tensors.items() if k.startswith("model.")})
+    weights_dtype = next(model.parameters()).dtype
+    if torch.device(device).type == "cpu" and weights_dtype != torch.float32:
+        # half precision is slow on cpu, full precision as load_checkpoint picks there, at the cost of a private copy.
+        # bf16 weights keep bf16 compute as autocast, see load_model()
+        model = model.float()
+        if weights_dtype == torch.bfloat16:
+            model.autocast_dtype = torch.bfloat16
+
+    with tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False) as f:
+        f.write(metadata["vocoder_config"])
+    vocoder = Vocos.from_hparams(f.name)
+    os.remove(f.name)
+    load_state_dict_mapped(vocoder, {k[len("vocoder.") :]: v for k, v in tensors.items() if k.startswith("vocoder.")})
+
+    # off cpu the weights are copied to the device anyway
+    return model.eval().to(device), vocoder.eval().to(device)
+
+
 def remove_silence_edges(audio, silence_threshold=-42):
+    from pydub import silence
+
     # Remove silence from the start
     non_silent_start_idx = silence.detect_leading_silence(audio, silence_threshold=silence_threshold)
     audio = audio[non_silent_start_idx:]
@@ -290,6 +626,8 @@ def remove_silence_edges(audio, silence_threshold=-42):
 
 
 def preprocess_ref_audio_text(ref_audio_orig, ref_text, clip_short=True, show_info=print, device=device):
+    from pydub import AudioSegment, silence
+
     show_info("Converting audio...")
     with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as f:
         aseg = AudioSegment.from_file(ref_audio_orig)
@@ -375,7 +713,10 @@ def infer_process(
     target_rms=target_rms,
     cross_fade_duration=cross_fade_duration,
     nfe_step=nfe_step,
+    ode_method=None,
     cfg_strength=cfg_strength,
+    cfg_schedule=cfg_schedule,
+    cfg_skip_mode=cfg_skip_mode,
     sway_sampling_coef=sway_sampling_coef,
     speed=speed,
     fix_duration=fix_duration,
@@ -402,7 +743,10 @@ def infer_process(
             target_rms=target_rms,
             cross_fade_duration=cross_fade_duration,
             nfe_step=nfe_step,
+            ode_method=ode_method,
             cfg_strength=cfg_strength,
+            cfg_schedule=cfg_schedule,
+            cfg_skip_mode=cfg_skip_mode,
             sway_sampling_coef=sway_sampling_coef,
             speed=speed,
             fix_duration=fix_duration,
@@ -411,6 +755,125 @@ def infer_process(
     )
 
 
+# sample items with their own reference and text in one batched call, then vocode them in one batched call
+
+
+def prepare_ref_audio(audio, sr, target_rms=0.1, device=None):
+    # mono, loudness normalized and resampled reference, with its original rms to restore on the output
+    if audio.shape[0] > 1:
+        audio = torch.mean(audio, dim=0, keepdim=True)
+
+    rms = torch.sqrt(torch.mean(torch.square(audio)))
+    if rms < target_rms:
+        audio = audio * target_rms / rms
+    if sr != target_sample_rate:
+        resampler = torchaudio.transforms.Resample(sr, target_sample_rate)
+        audio = resampler(audio)
+    return audio.to(device), rms
+
+
+def prepare_text_duration(ref_text, gen_text, ref_audio_len, speed=1, fix_duration=None):
+    # model tokens of reference + generation text, and total frames to sample, reference included
+    if len(ref_text[-1].encode("utf-8")) == 1:
+        ref_text = ref_text + " "
+
+    local_speed = speed
+    if len(gen_text.encode("utf-8")) < 10:
+        local_speed = 0.3
+
+    # Prepare the text
+    text_list = [ref_text + gen_text]
+    final_text_list = convert_char_to_pinyin(text_list)
+
+    if fix_duration is not None:
+        duration = int(fix_duration * target_sample_rate / hop_length)
+    else:
+        # Calculate duration
+        ref_text_len = len(ref_text.encode("utf-8"))
+        gen_text_len = len(gen_text.encode("utf-8"))
+        duration = ref_audio_len + int(ref_audio_len / ref_text_len * gen_text_len / local_speed)
+
+    return final_text_list[0], duration
+
+
+def infer_batch_sample(
+    model_obj,
+    vocoder,
+    ref_mels,  # list of reference mel, n d
+    ref_audio_lens,  # list of frames to cut from the start of each generated mel
+    final_texts,  # list of reference + generation text, already converted to model tokens
+    durations,  # list of total frames, reference included
+    mel_spec_type="vocos",
+    nfe_step=32,
+    ode_method=None,
+    cfg_strength=2.0,
+    cfg_schedule=None,
+    cfg_skip_mode="reuse",
+    sway_sampling_coef=-1,
+    max_duration=4096,
+    workspace=None,  # SampleWorkspace reused across calls, see CFM.sample
+    seed=None,  # same noise for an item whatever it is batched with, see CFM.sample
+):
+    device = ref_mels[0].device
+    lens = torch.tensor([ref_mel.shape[0] for ref_mel in ref_mels], dtype=torch.long, device=device)
+
+    with torch.inference_mode():
+        generated, _ = model_obj.sample(
+            cond=pad_sequence(ref_mels, batch_first=True),
+            text=final_texts,
+            duration=torch.tensor(durations, dtype=torch.long, device=device),
+            lens=lens,
+            steps=nfe_step,
+            ode_method=ode_method,
+            cfg_strength=cfg_strength,
+            cfg_schedule=cfg_schedule,
+            cfg_skip_mode=cfg_skip_mode,
+            sway_sampling_coef=sway_sampling_coef,
+            max_duration=max_duration,
+            workspace=workspace,
+            seed=seed,
+        )
+        del _
+
+        # frames actually generated for each item, as clamped in CFM.sample
+        total_lens = [
+            min(max(max(len(final_text), ref_len) + 1, duration), max_duration)
+            for final_text, ref_len, duration in zip(final_texts, lens.tolist(), durations)
+        ]
+        generated = generated.to(torch.float32)  # generated mel spectrogram
+        generated_mels = [
+            gen[ref_audio_len:total_len] for gen, ref_audio_len, total_len in zip(generated, ref_audio_lens, total_lens)
+        ]
+        return decode_mels(vocoder, generated_mels, mel_spec_type)
+
+
+def decode_mels(vocoder, generated_mels, mel_spec_type="vocos"):
+    # list of mel (n d) of different lengths -> list of (wave, mel) numpy
+    # only mels of the same length are vocoded together. padding would reach the last frames of shorter ones through
+    # the vocoder's receptive field, and they would no longer sound as decoded alone
+    groups = {}
+    for i, gen in enumerate(generated_mels):
+        groups.setdefault(gen.shape[0], []).append(i)
+
+    outputs = [None] * len(generated_mels)
+    with torch.inference_mode():
+        for indices in groups.values():
+            mels = torch.stack([generated_mels[i] for i in indices]).permute(0, 2, 1)
+            if mel_spec_type == "vocos":
+                generated_waves = vocoder.decode(mels)
+            elif mel_spec_type == "bigvgan":
+                generated_waves = vocoder(mels).squeeze(1)
+
+            # wav -> numpy
+            for i, generated_wave in zip(indices, generated_waves):
+                gen = generated_mels[i]
+                outputs[i] = (
+                    generated_wave[: gen.shape[0] * hop_length].cpu().numpy(),
+                    gen.permute(1, 0).cpu().numpy(),
+                )
+    return outputs
+
+
 # infer batches
 
 
@@ -425,59 +888,42 @@ def infer_batch_process(
     target_rms=0.1,
     cross_fade_duration=0.15,
     nfe_step=32,
+    ode_method=None,
     cfg_strength=2.0,
+    cfg_schedule=None,
+    cfg_skip_mode="reuse",
     sway_sampling_coef=-1,
     speed=1,
     fix_duration=None,
     device=None,
     streaming=False,
     chunk_size=2048,
+    batch_frame_budget=16384,  # max padded frames per batched sample call, non-streaming only
+    workspace=None,  # SampleWorkspace reused across calls, e.g. by a server, see CFM.sample
 ):
-    audio, sr = ref_audio
-    if audio.shape[0] > 1:
-        audio = torch.mean(audio, dim=0, keepdim=True)
-
-    rms = torch.sqrt(torch.mean(torch.square(audio)))
-    if rms < target_rms:
-        audio = audio * target_rms / rms
-    if sr != target_sample_rate:
-        resampler = torchaudio.transforms.Resample(sr, target_sample_rate)
-        audio = resampler(audio)
-    audio = audio.to(device)
+    audio, rms = prepare_ref_audio(*ref_audio, target_rms=target_rms, device=device)
 
     generated_waves = []
     spectrograms = []
 
-    if len(ref_text[-1].encode("utf-8")) == 1:
-        ref_text = ref_text + " "
+    ref_audio_len = audio.shape[-1] // hop_length
 
     def process_batch(gen_text):
-        local_speed = speed
-        if len(gen_text.encode("utf-8")) < 10:
-            local_speed = 0.3
-
-        # Prepare the text
-        text_list = [ref_text + gen_text]
-        final_text_list = convert_char_to_pinyin(text_list)
-
-        ref_audio_len = audio.shape[-1] // hop_length
-        if fix_duration is not None:
-            duration = int(fix_duration * target_sample_rate / hop_length)
-        else:
-            # Calculate duration
-            ref_text_len = len(ref_text.encode("utf-8"))
-            gen_text_len = len(gen_text.encode("utf-8"))
-            duration = ref_audio_len + int(ref_audio_len / ref_text_len * gen_text_len / local_speed)
+        final_text, duration = prepare_text_duration(ref_text, gen_text, ref_audio_len, speed, fix_duration)
 
         # inference
         with torch.inference_mode():
             generated, _ = model_obj.sample(
                 cond=audio,
-                text=final_text_list,
+                text=[final_text],
                 duration=duration,
                 steps=nfe_step,
+                ode_method=ode_method,
                 cfg_strength=cfg_strength,
+                cfg_schedule=cfg_schedule,
+                cfg_skip_mode=cfg_skip_mode,
                 sway_sampling_coef=sway_sampling_coef,
+                workspace=workspace,
             )
             del _
 
@@ -494,27 +940,64 @@ def infer_batch_process(
             # wav -> numpy
             generated_wave = generated_wave.squeeze().cpu().numpy()
 
-            if streaming:
-                for j in range(0, len(generated_wave), chunk_size):
-                    yield generated_wave[j : j + chunk_size], target_sample_rate
-            else:
-                generated_cpu = generated[0].cpu().numpy()
-                del generated
-                yield generated_wave, generated_cpu
+            for j in range(0, len(generated_wave), chunk_size):
+                yield generated_wave[j : j + chunk_size], target_sample_rate
 
     if streaming:
         for gen_text in progress.tqdm(gen_text_batches) if progress is not None else gen_text_batches:
             for chunk in process_batch(gen_text):
                 yield chunk
     else:
-        with ThreadPoolExecutor() as executor:
-            futures = [executor.submit(process_batch, gen_text) for gen_text in gen_text_batches]
-            for future in progress.tqdm(futures) if progress is not None else futures:
-                result = future.result()
-                if result:
-                    generated_wave, generated_mel_spec = next(result)
-                    generated_waves.append(generated_wave)
-                    spectrograms.append(generated_mel_spec)
+        # pack all chunks into as few batched sample calls as the frame budget allows, longest first
+        final_texts, durations = [], []
+        for gen_text in gen_text_batches:
+            final_text, duration = prepare_text_duration(ref_text, gen_text, ref_audio_len, speed, fix_duration)
+            final_texts.append(final_text)
+            durations.append(duration)
+
+        # a compiled model only takes the batch sizes it was compiled for
+        batch_buckets = getattr(model_obj, "batch_buckets", None)
+        max_batch_size = batch_buckets[-1] if batch_buckets else len(durations)
+        sub_batches = []
+        for i in sorted(range(len(durations)), key=lambda i: durations[i], reverse=True):
+            if (
+                sub_batches
+                and len(sub_batches[-1]) < max_batch_size
+                and (len(sub_batches[-1]) + 1) * durations[sub_batches[-1][0]] <= batch_frame_budget
+            ):
+                sub_batches[-1].append(i)
+            else:
+                sub_batches.append([i])
+
+        with torch.inference_mode():
+            ref_mel = model_obj.mel_spec(audio).permute(0, 2, 1)[0]  # 1 d n -> n d
+
+        results = [None] * len(gen_text_batches)
+        for sub_batch in progress.tqdm(sub_batches) if progress is not None else sub_batches:
+            outputs = infer_batch_sample(
+                model_obj,
+                vocoder,
+                [ref_mel] * len(sub_batch),
+                [ref_audio_len] * len(sub_batch),
+                [final_texts[i] for i in sub_batch],
+                [durations[i] for i in sub_batch],
+                mel_spec_type=mel_spec_type,
+                nfe_step=nfe_step,
+                ode_method=ode_method,
+                cfg_strength=cfg_strength,
+                cfg_schedule=cfg_schedule,
+                cfg_skip_mode=cfg_skip_mode,
+                sway_sampling_coef=sway_sampling_coef,
+                workspace=workspace,
+            )
+            for i, (generated_wave, generated_mel_spec) in zip(sub_batch, outputs):
+                if rms < target_rms:
+                    generated_wave = generated_wave * (rms / target_rms).item()
+                results[i] = (generated_wave, generated_mel_spec)
+
+        for generated_wave, generated_mel_spec in results:
+            generated_waves.append(generated_wave)
+            spectrograms.append(generated_mel_spec)
 
         if generated_waves:
             if cross_fade_duration <= 0:
@@ -567,6 +1050,8 @@ def infer_batch_process(
 
 
 def remove_silence_for_generated_wav(filename):
+    from pydub import AudioSegment, silence
+
     aseg = AudioSegment.from_file(filename)
     non_silent_segs = silence.split_on_silence(
         aseg, min_silence_len=1000, silence_thresh=-50, keep_silence=500, seek_step=10
@@ -582,6 +1067,11 @@ def remove_silence_for_generated_wav(filename):
 
 
 def save_spectrogram(spectrogram, path):
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pylab as plt
+
     plt.figure(figsize=(12, 4))
     plt.imshow(spectrogram, origin="lower", aspect="auto")
     plt.colorbar()
@@ -0,0 +1,274 @@
+# ONNX export of the DiT sampling graph and Vocos decoder, and an onnxruntime backend for inference
+# CFM.sample runs its integration loop unchanged, with OnnxDiT / OnnxVocos standing in for the torch modules
+
+from __future__ import annotations
+
+import json
+import os
+
+import torch
+from torch import nn
+
+from f5_tts.model.backbones.dit import DiT
+from f5_tts.model.modules import TimeCondCache
+
+
+ONNX_CONFIG = "config.json"
+
+
+# export wrappers, so each graph only has plain tensor inputs and outputs
+
+
+class CondEmbedExport(nn.Module):
+    # text & cond audio part of the input projection, for cond and uncond (cfg), once per sample call
+    def __init__(self, transformer: DiT):
+        super().__init__()
+        self.transformer = transformer
+
+    def forward(self, cond, text):
+        seq_len = cond.shape[1]
+        text_embed = self.transformer.text_embed(text, seq_len, drop_text=False)
+        cond_embed = self.transformer.input_embed.embed_cond(cond, text_embed, drop_audio_cond=False)
+        text_embed = self.transformer.text_embed(text, seq_len, drop_text=True)
+        uncond_embed = self.transformer.input_embed.embed_cond(cond, text_embed, drop_audio_cond=True)
+        return cond_embed, uncond_embed
+
+
+class TimeCondExport(nn.Module):
+    # time embedding and all adaln modulations, once per sample call for the whole ode schedule
+    def __init__(self, transformer: DiT):
+        super().__init__()
+        self.transformer = transformer
+
+    def forward(self, time):
+        t, t_mod_final, t_mods = self.transformer.embed_time(time)
+        return t, t_mod_final, torch.stack(t_mods)
+
+
+class TransformerExport(nn.Module):
+    # per step forward, from the noised audio and the precomputed conditioning
+    def __init__(self, transformer: DiT):
+        super().__init__()
+        self.transformer = transformer
+
+    def forward(self, x, cond_embed, mask, t, t_mod_final, t_mods):
+        x = self.transformer.input_embed(x, None, None, cond_embed=cond_embed, audio_mask=mask)
+        return self.transformer.forward_from_embed(x, t, t_mod_final, list(t_mods.unbind(0)), mask=mask)
+
+
+class VocosExport(nn.Module):
+    # backbone and head up to the complex spectrum, the istft is done outside the graph as onnx has no istft op
+    def __init__(self, vocoder):
+        super().__init__()
+        self.vocoder = vocoder
+
+    def forward(self, mel):
+        x = self.vocoder.backbone(mel)
+        x = self.vocoder.head.out(x).transpose(1, 2)
+        mag, p = x.chunk(2, dim=1)
+        mag = torch.exp(mag).clip(max=1e2)
+        return mag * torch.cos(p), mag * torch.sin(p)
+
+
+@torch.no_grad()
+def export_onnx(model, vocoder, output_dir, opset_version=17):
+    transformer = model.transformer
+    if not isinstance(transformer, DiT):
+        raise ValueError(f"ONNX export is only supported for DiT backbone, got {type(transformer).__name__}")
+    if not hasattr(vocoder, "backbone"):
+        raise ValueError("ONNX export is only supported for vocos vocoder")
+    os.makedirs(output_dir, exist_ok=True)
+    model, vocoder = model.float().eval(), vocoder.float().eval()
+
+    device = model.device
+    batch, seq_len, text_len, steps = 2, 256, 64, 8
+    mel_dim, dim, depth = model.num_channels, transformer.dim, transformer.depth
+    x = torch.randn(batch, seq_len, mel_dim, device=device)
+    cond = torch.randn(batch, seq_len, mel_dim, device=device)
+    text = torch.randint(0, 32, (batch, text_len), device=device)
+    mask = torch.ones(batch, seq_len, dtype=torch.bool, device=device)
+    time = torch.linspace(0, 1, steps, device=device)
+
+    def export(module, args, name, input_names, output_names, dynamic_axes):
+        torch.onnx.export(
+            module,
+            args,
+            os.path.join(output_dir, f"{name}.onnx"),
+            input_names=input_names,
+            output_names=output_names,
+            dynamic_axes=dynamic_axes,
+            opset_version=opset_version,
+        )
+
+    export(
+        CondEmbedExport(transformer),
+        (cond, text),
+        "cond_embed",
+        ["cond", "text"],
+        ["cond_embed", "uncond_embed"],
+        {
+            "cond": {0: "batch", 1: "seq_len"},
+            "text": {0: "batch", 1: "text_len"},
+            "cond_embed": {0: "batch", 1: "seq_len"},
+            "uncond_embed": {0: "batch", 1: "seq_len"},
+        },
+    )
+    t, t_mod_final, t_mods = TimeCondExport(transformer)(time)
+    export(
+        TimeCondExport(transformer),
+        (time,),
+        "time_cond",
+        ["time"],
+        ["t", "t_mod_final", "t_mods"],
+        {"time": {0: "steps"}, "t": {0: "steps"}, "t_mod_final": {0: "steps"}, "t_mods": {1: "steps"}},
+    )
+    cond_embed = torch.randn(batch, seq_len, dim, device=device)
+    export(
+        TransformerExport(transformer),
+        (x, cond_embed, mask, t[:batch], t_mod_final[:batch], t_mods[:, :batch]),
+        "transformer",
+        ["x", "cond_embed", "mask", "t", "t_mod_final", "t_mods"],
+        ["pred"],
+        {
+            "x": {0: "batch", 1: "seq_len"},
+            "cond_embed": {0: "batch", 1: "seq_len"},
+            "mask": {0: "batch", 1: "seq_len"},
+            "t": {0: "batch"},
+            "t_mod_final": {0: "batch"},
+            "t_mods": {1: "batch"},
+            "pred": {0: "batch", 1: "seq_len"},
+        },
+    )
+    export(
+        VocosExport(vocoder),
+        (x.permute(0, 2, 1),),
+        "vocoder",
+        ["mel"],
+        ["real", "imag"],
+        {"mel": {0: "batch", 2: "frames"}, "real": {0: "batch", 2: "frames"}, "imag": {0: "batch", 2: "frames"}},
+    )
+
+    istft = vocoder.head.istft
+    config = dict(
+        dim=dim,
+        depth=depth,
+        istft=dict(n_fft=istft.n_fft, hop_length=istft.hop_length, win_length=istft.win_length, padding=istft.padding),
+    )
+    with open(os.path.join(output_dir, ONNX_CONFIG), "w") as f:
+        json.dump(config, f, indent=4)
+
+
+# onnxruntime backend
+
+
+def load_onnx_session(path, device="cpu"):
+    import onnxruntime as ort
+
+    providers = ["CUDAExecutionProvider", "CPUExecutionProvider"] if "cuda" in device else ["CPUExecutionProvider"]
+    options = ort.SessionOptions()
+    # follow the torch thread budget of this worker, see utils_runtime.configure_threads()
+    options.intra_op_num_threads = torch.get_num_threads()
+    options.inter_op_num_threads = torch.get_num_interop_threads()
+    return ort.InferenceSession(path, sess_options=options, providers=providers)
+
+
+def run_onnx_session(session, **inputs):
+    outputs = session.run(None, {name: value.detach().cpu().numpy() for name, value in inputs.items()})
+    return [torch.from_numpy(output) for output in outputs]
+
+
+class OnnxDiT(nn.Module):
+    # same sampling interface as DiT (forward, precompute_time_cond), backed by the exported onnx graphs
+    def __init__(self, onnx_dir, device="cpu"):
+        super().__init__()
+        with open(os.path.join(onnx_dir, ONNX_CONFIG)) as f:
+            config = json.load(f)
+        self.dim, self.depth = config["dim"], config["depth"]
+        self.sessions = {
+            name: load_onnx_session(os.path.join(onnx_dir, f"{name}.onnx"), device)
+            for name in ["cond_embed", "time_cond", "transformer"]
+        }
+        # no weights on the torch side, only anchors CFM's device and dtype (graphs are exported in fp32)
+        self.anchor = nn.Parameter(torch.empty(0), requires_grad=False)
+
+    def embed_time(self, time: float["s"]):  # noqa: F821
+        t, t_mod_final, t_mods = run_onnx_session(self.sessions["time_cond"], time=time.float())
+        return t, t_mod_final, list(t_mods.unbind(0))
+
+    def precompute_time_cond(self, time: float["s"]):  # noqa: F821
+        t, t_mod_final, t_mods = self.embed_time(time)
+        return TimeCondCache(time.cpu(), t, t_mod_final, *t_mods)
+
+    def get_time_cond(self, time: float["b"], cache=None):  # noqa: F821
+        if cache is not None and cache.time_cond is not None:
+            time_cond = cache.time_cond.lookup(time.cpu())
+            if time_cond is not None:
+                t, t_mod_final, *t_mods = time_cond
+                return t, t_mod_final, t_mods
+        return self.embed_time(time)
+
+    def forward(
+        self,
+        x: float["b n d"],  # nosied input audio  # noqa: F722
+        cond: float["b n d"],  # masked cond audio  # noqa: F722
+        text: int["b nt"],  # text  # noqa: F722
+        time: float["b"] | float[""],  # time step  # noqa: F821 F722
+        drop_audio_cond: bool = False,  # cfg for cond audio
+        drop_text: bool = False,  # cfg for text
+        mask: bool["b n"] | None = None,  # noqa: F722
+        cache=None,  # per-call sampling cache, created by CFM.sample
+        cfg_infer: bool = False,  # cfg inference, pack cond & uncond forward
+    ):
+        if drop_audio_cond != drop_text:
+            raise ValueError("OnnxDiT only has the cond and the fully dropped uncond embedding exported")
+        batch, seq_len = x.shape[0], x.shape[1]
+        if time.ndim == 0:
+            time = time.repeat(batch)
+        if mask is None:
+            mask = torch.ones(batch, seq_len, dtype=torch.bool)
+
+        if cache is not None and cache.text_cond is not None:
+            cond_embed, uncond_embed = cache.text_cond, cache.text_uncond
+        else:
+            cond_embed, uncond_embed = run_onnx_session(self.sessions["cond_embed"], cond=cond.float(), text=text)
+            if cache is not None:
+                cache.text_cond, cache.text_uncond = cond_embed, uncond_embed
+
+        t, t_mod_final, t_mods = self.get_time_cond(time, cache)
+        t_mods = torch.stack(t_mods)
+        if cfg_infer:  # pack cond & uncond forward: b n d -> 2b n d
+            x = torch.cat((x, x), dim=0)
+            cond_embed = torch.cat((cond_embed, uncond_embed), dim=0)
+            mask = torch.cat((mask, mask), dim=0)
+            t = torch.cat((t, t), dim=0)
+            t_mod_final = torch.cat((t_mod_final, t_mod_final), dim=0)
+            t_mods = torch.cat((t_mods, t_mods), dim=1)
+        elif drop_text:
+            cond_embed = uncond_embed
+
+        (pred,) = run_onnx_session(
+            self.sessions["transformer"],
+            x=x.float(),
+            cond_embed=cond_embed,
+            mask=mask,
+            t=t,
+            t_mod_final=t_mod_final,
+            t_mods=t_mods,
+        )
+        return pred.to(x.device, x.dtype)
+
+
+class OnnxVocos:
+    # vocos decode, the exported graph up to the complex spectrum then the torch istft
+    def __init__(self, onnx_dir, device="cpu"):
+        from vocos.spectral_ops import ISTFT
+
+        with open(os.path.join(onnx_dir, ONNX_CONFIG)) as f:
+            config = json.load(f)
+        self.session = load_onnx_session(os.path.join(onnx_dir, "vocoder.onnx"), device)
+        self.istft = ISTFT(**config["istft"])
+        self.device = device
+
+    def decode(self, mel: float["b d n"]):  # noqa: F722
+        real, imag = run_onnx_session(self.session, mel=mel.float())
+        return self.istft(torch.complex(real, imag)).to(self.device)
@@ -0,0 +1,64 @@
+# CPU thread budget for inference, splits the host cores across model worker processes
+# by default every worker sizes its torch intra-op pool to all cores, so several workers on one host oversubscribe
+
+import os
+
+import torch
+
+
+def get_available_cores():
+    # cores this process may run on, respects taskset / cgroup cpusets
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_core_list(cores: str):
+    # "0-3,8,10-11" -> [0, 1, 2, 3, 8, 10, 11], same format as taskset -c
+    core_list = []
+    for part in cores.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        core_list.extend(range(int(start), int(end or start) + 1))
+    return core_list
+
+
+def get_thread_budget(num_workers=1, worker_rank=0, cores=None, inter_op_threads=1):
+    # a contiguous slice of the cores for this worker, its intra-op pool fills the slice
+    # inter-op pool kept small, sampling is a sequential chain of ops with little to run concurrently
+    cores = get_available_cores() if cores is None else list(cores)
+    if not 0 <= worker_rank < num_workers:
+        raise ValueError(f"worker_rank should be in [0, {num_workers}), got {worker_rank}")
+    if num_workers > len(cores):
+        raise ValueError(f"More workers ({num_workers}) than available cores ({len(cores)})")
+    per_worker = len(cores) // num_workers
+    worker_cores = cores[worker_rank * per_worker : (worker_rank + 1) * per_worker]
+    return dict(intra_op_threads=len(worker_cores), inter_op_threads=inter_op_threads, cores=worker_cores)
+
+
+def configure_threads(intra_op_threads=None, inter_op_threads=None, cores=None):
+    # call at worker start, before any inference: the inter-op pool can only be sized before its first use
+    if cores is not None:
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cores)
+        else:
+            print("CPU affinity is not supported on this platform, cores are not pinned")
+    if intra_op_threads is not None:
+        torch.set_num_threads(intra_op_threads)
+    if inter_op_threads is not None and inter_op_threads != torch.get_num_interop_threads():
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError:  # parallel work already started in this process
+            print(f"Inter-op threads already fixed, keeping {torch.get_num_interop_threads()}")
+
+
+def setup_worker_threads(num_workers=1, worker_rank=0, cores=None, inter_op_threads=1, pin_cores=False):
+    budget = get_thread_budget(num_workers, worker_rank, cores, inter_op_threads)
+    configure_threads(budget["intra_op_threads"], budget["inter_op_threads"], budget["cores"] if pin_cores else None)
+    print(
+        f"worker {worker_rank}/{num_workers}: {budget['intra_op_threads']} intra-op, "
+        f"{budget['inter_op_threads']} inter-op threads" + (f", cores {budget['cores']}" if pin_cores else "")
+    )
+    return budget
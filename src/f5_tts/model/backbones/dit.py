@@ -21,6 +21,8 @@ from f5_tts.model.modules import (
     ConvPositionEmbedding,
     DiTBlock,
     AdaLayerNorm_Final,
+    TimeCondCache,
+    SampleCache,
     precompute_freqs_cis,
     get_pos_embed_indices,
 )
@@ -85,15 +87,34 @@ class TextEmbedding(nn.Module):
 class InputEmbedding(nn.Module):
     def __init__(self, mel_dim, text_dim, out_dim):
         super().__init__()
+        self.mel_dim = mel_dim
         self.proj = nn.Linear(mel_dim * 2 + text_dim, out_dim)
         self.conv_pos_embed = ConvPositionEmbedding(dim=out_dim)
 
-    def forward(self, x: float["b n d"], cond: float["b n d"], text_embed: float["b n d"], drop_audio_cond=False):  # noqa: F722
+    def embed_cond(self, cond: float["b n d"], text_embed: float["b n d"], drop_audio_cond=False):  # noqa: F722
+        # step-invariant part of the input projection (cond audio & text), reusable across all ode steps
         if drop_audio_cond:  # cfg for cond audio
             cond = torch.zeros_like(cond)
 
-        x = self.proj(torch.cat((x, cond, text_embed), dim=-1))
-        x = self.conv_pos_embed(x) + x
+        return F.linear(torch.cat((cond, text_embed), dim=-1), self.proj.weight[:, self.mel_dim :], self.proj.bias)
+
+    def forward(
+        self,
+        x: float["b n d"],  # noqa: F722
+        cond: float["b n d"],  # noqa: F722
+        text_embed: float["b n d"],  # noqa: F722
+        drop_audio_cond=False,
+        cond_embed: float["b n d"] | None = None,  # precomputed with embed_cond()  # noqa: F722
+        audio_mask: bool["b n"] | None = None,  # noqa: F722
+    ):
+        if cond_embed is not None:  # only noised audio x changes between steps
+            x = F.linear(x, self.proj.weight[:, : self.mel_dim]) + cond_embed
+        else:
+            if drop_audio_cond:  # cfg for cond audio
+                cond = torch.zeros_like(cond)
+
+            x = self.proj(torch.cat((x, cond, text_embed), dim=-1))
+        x = self.conv_pos_embed(x, mask=audio_mask) + x
         return x
 
 
@@ -117,6 +138,7 @@ class DiT(nn.Module):
         qk_norm=None,
         conv_layers=0,
         pe_attn_head=None,
+        attn_chunk_size=None,  # attention in query blocks, bounds memory for long inputs, see AttnProcessor
         long_skip_connection=False,
         checkpoint_activations=False,
     ):
@@ -128,7 +150,6 @@ class DiT(nn.Module):
         self.text_embed = TextEmbedding(
             text_num_embeds, text_dim, mask_padding=text_mask_padding, conv_layers=conv_layers
         )
-        self.text_cond, self.text_uncond = None, None  # text cache
         self.input_embed = InputEmbedding(mel_dim, text_dim, dim)
 
         self.rotary_embed = RotaryEmbedding(dim_head)
@@ -146,6 +167,7 @@ class DiT(nn.Module):
                     dropout=dropout,
                     qk_norm=qk_norm,
                     pe_attn_head=pe_attn_head,
+                    attn_chunk_size=attn_chunk_size,
                 )
                 for _ in range(depth)
             ]
@@ -179,8 +201,100 @@ class DiT(nn.Module):
 
         return ckpt_forward
 
-    def clear_cache(self):
-        self.text_cond, self.text_uncond = None, None
+    def get_input_embed(
+        self,
+        x,  # b n d
+        cond,  # b n d
+        text,  # b nt
+        drop_audio_cond: bool = False,
+        drop_text: bool = False,
+        cache: SampleCache | None = None,
+        audio_mask: bool["b n"] | None = None,  # noqa: F722
+    ):
+        seq_len = x.shape[1]
+        if cache is not None:  # text and cond audio are fixed during sampling, cache the step-invariant projection
+            if drop_text:
+                if cache.text_uncond is None:
+                    text_embed = self.text_embed(text, seq_len, drop_text=True)
+                    cache.text_uncond = self.input_embed.embed_cond(cond, text_embed, drop_audio_cond=drop_audio_cond)
+                cond_embed = cache.text_uncond
+            else:
+                if cache.text_cond is None:
+                    text_embed = self.text_embed(text, seq_len, drop_text=False)
+                    cache.text_cond = self.input_embed.embed_cond(cond, text_embed, drop_audio_cond=drop_audio_cond)
+                cond_embed = cache.text_cond
+            x = self.input_embed(x, cond, None, cond_embed=cond_embed, audio_mask=audio_mask)
+        else:
+            text_embed = self.text_embed(text, seq_len, drop_text=drop_text)
+            x = self.input_embed(x, cond, text_embed, drop_audio_cond=drop_audio_cond, audio_mask=audio_mask)
+
+        return x
+
+    def embed_time(self, time: float["s"]):  # noqa: F821
+        # time embedding and all adaln modulations, one matmul per layer for all given time steps
+        t = self.time_embed(time)
+        t_mods = [block.attn_norm.linear(block.attn_norm.silu(t)) for block in self.transformer_blocks]
+        t_mod_final = self.norm_out.linear(self.norm_out.silu(t))
+        return t, t_mod_final, t_mods
+
+    def precompute_time_cond(self, time: float["s"]):  # noqa: F821
+        # for the known ode time steps
+        t, t_mod_final, t_mods = self.embed_time(time)
+        return TimeCondCache(time, t, t_mod_final, *t_mods)
+
+    def get_time_cond(self, time: float["b"], cache: SampleCache | None = None):  # noqa: F821
+        if cache is not None and cache.time_cond is not None:
+            time_cond = cache.time_cond.lookup(time)
+            if time_cond is not None:
+                t, t_mod_final, *t_mods = time_cond
+                return t, t_mod_final, t_mods
+        return self.time_embed(time), None, [None] * self.depth
+
+    def enable_block_cache(self, cache: SampleCache, threshold: float):
+        # reuse the residual of deep blocks (all but the first) from the last computed step, while the accumulated
+        # relative change of the first block's modulated input stays below threshold (teacache-like)
+        cache.block_cache = dict(threshold=threshold, states=dict(), evaluated=0, skipped=0)
+
+    def get_block_cache_stats(self, cache: SampleCache):
+        if cache.block_cache is None:
+            return dict(evaluated=0, skipped=0)
+        return dict(evaluated=cache.block_cache["evaluated"], skipped=cache.block_cache["skipped"])
+
+    def forward_blocks(self, x, t, t_mods, mask, rope):
+        for block, t_mod in zip(self.transformer_blocks, t_mods):
+            if self.checkpoint_activations:
+                # https://pytorch.org/docs/stable/checkpoint.html#torch.utils.checkpoint.checkpoint
+                x = torch.utils.checkpoint.checkpoint(self.ckpt_wrapper(block), x, t, mask, rope, use_reentrant=False)
+            else:
+                x = block(x, t, mask=mask, rope=rope, t_mod=t_mod)
+        return x
+
+    def forward_cached_blocks(self, x, t, t_mods, mask, rope, block_cache, cache_key):
+        first_block, deep_blocks = self.transformer_blocks[0], self.transformer_blocks[1:]
+        state = block_cache["states"].setdefault(cache_key, dict(acc_change=0.0))  # cond / packed cfg kept apart
+
+        indicator = first_block.attn_norm(x, emb=t, emb_mod=t_mods[0])[0]
+        reuse = False
+        if "indicator" in state:
+            prev_indicator = state["indicator"]
+            rel_change = (indicator - prev_indicator).abs().mean() / prev_indicator.abs().mean()
+            state["acc_change"] += rel_change.item()
+            reuse = state["acc_change"] < block_cache["threshold"]
+        state["indicator"] = indicator
+
+        x = first_block(x, t, mask=mask, rope=rope, t_mod=t_mods[0])
+        if reuse:
+            block_cache["evaluated"] += 1
+            block_cache["skipped"] += len(deep_blocks)
+            return x + state["residual"]
+
+        residual = x
+        for block, t_mod in zip(deep_blocks, t_mods[1:]):
+            x = block(x, t, mask=mask, rope=rope, t_mod=t_mod)
+        state["residual"] = x - residual
+        state["acc_change"] = 0.0
+        block_cache["evaluated"] += self.depth
+        return x
 
     def forward(
         self,
@@ -188,46 +302,65 @@ class DiT(nn.Module):
         cond: float["b n d"],  # masked cond audio  # noqa: F722
         text: int["b nt"],  # text  # noqa: F722
         time: float["b"] | float[""],  # time step  # noqa: F821 F722
-        drop_audio_cond,  # cfg for cond audio
-        drop_text,  # cfg for text
+        drop_audio_cond: bool = False,  # cfg for cond audio
+        drop_text: bool = False,  # cfg for text
         mask: bool["b n"] | None = None,  # noqa: F722
-        cache=False,
+        cache: SampleCache | None = None,  # per-call sampling cache, created by CFM.sample
+        cfg_infer: bool = False,  # cfg inference, pack cond & uncond forward
     ):
-        batch, seq_len = x.shape[0], x.shape[1]
+        batch = x.shape[0]
         if time.ndim == 0:
             time = time.repeat(batch)
 
         # t: conditioning time, text: text, x: noised audio + cond audio + text
-        t = self.time_embed(time)
-        if cache:
-            if drop_text:
-                if self.text_uncond is None:
-                    self.text_uncond = self.text_embed(text, seq_len, drop_text=True)
-                text_embed = self.text_uncond
-            else:
-                if self.text_cond is None:
-                    self.text_cond = self.text_embed(text, seq_len, drop_text=False)
-                text_embed = self.text_cond
+        t, t_mod_final, t_mods = self.get_time_cond(time, cache)
+        if cfg_infer:  # pack cond & uncond forward: b n d -> 2b n d
+            x_cond = self.get_input_embed(
+                x, cond, text, drop_audio_cond=False, drop_text=False, cache=cache, audio_mask=mask
+            )
+            x_uncond = self.get_input_embed(
+                x, cond, text, drop_audio_cond=True, drop_text=True, cache=cache, audio_mask=mask
+            )
+            x = torch.cat((x_cond, x_uncond), dim=0)
+            t = torch.cat((t, t), dim=0)
+            if t_mod_final is not None:
+                t_mod_final = torch.cat((t_mod_final, t_mod_final), dim=0)
+                t_mods = [torch.cat((t_mod, t_mod), dim=0) for t_mod in t_mods]
+            mask = torch.cat((mask, mask), dim=0) if mask is not None else None
         else:
-            text_embed = self.text_embed(text, seq_len, drop_text=drop_text)
-        x = self.input_embed(x, cond, text_embed, drop_audio_cond=drop_audio_cond)
+            x = self.get_input_embed(
+                x, cond, text, drop_audio_cond=drop_audio_cond, drop_text=drop_text, cache=cache, audio_mask=mask
+            )
+
+        block_cache = cache.block_cache if cache is not None else None
+        return self.forward_from_embed(
+            x, t, t_mod_final, t_mods, mask=mask, block_cache=block_cache, cache_key=(cfg_infer, drop_text)
+        )
 
-        rope = self.rotary_embed.forward_from_seq_len(seq_len)
+    def forward_from_embed(
+        self,
+        x: float["b n d"],  # input embedding  # noqa: F722
+        t: float["b d"],  # time embedding  # noqa: F722
+        t_mod_final: float["b d"] | None,  # noqa: F722
+        t_mods: list[float["b d"] | None],  # noqa: F722
+        mask: bool["b n"] | None = None,  # noqa: F722
+        block_cache: dict | None = None,
+        cache_key=None,
+    ):
+        rope = self.rotary_embed.forward_from_seq_len(x.shape[1])
 
         if self.long_skip_connection is not None:
             residual = x
 
-        for block in self.transformer_blocks:
-            if self.checkpoint_activations:
-                # https://pytorch.org/docs/stable/checkpoint.html#torch.utils.checkpoint.checkpoint
-                x = torch.utils.checkpoint.checkpoint(self.ckpt_wrapper(block), x, t, mask, rope, use_reentrant=False)
-            else:
-                x = block(x, t, mask=mask, rope=rope)
+        if block_cache is not None:
+            x = self.forward_cached_blocks(x, t, t_mods, mask, rope, block_cache, cache_key=cache_key)
+        else:
+            x = self.forward_blocks(x, t, t_mods, mask, rope)
 
         if self.long_skip_connection is not None:
             x = self.long_skip_connection(torch.cat((x, residual), dim=-1))
 
-        x = self.norm_out(x, t)
+        x = self.norm_out(x, t, emb_mod=t_mod_final)
         output = self.proj_out(x)
 
         return output
@@ -19,6 +19,8 @@ from f5_tts.model.modules import (
     ConvPositionEmbedding,
     MMDiTBlock,
     AdaLayerNorm_Final,
+    TimeCondCache,
+    SampleCache,
     precompute_freqs_cis,
     get_pos_embed_indices,
 )
@@ -70,12 +72,18 @@ class AudioEmbedding(nn.Module):
         self.linear = nn.Linear(2 * in_dim, out_dim)
         self.conv_pos_embed = ConvPositionEmbedding(out_dim)
 
-    def forward(self, x: float["b n d"], cond: float["b n d"], drop_audio_cond=False):  # noqa: F722
+    def forward(
+        self,
+        x: float["b n d"],  # noqa: F722
+        cond: float["b n d"],  # noqa: F722
+        drop_audio_cond=False,
+        audio_mask: bool["b n"] | None = None,  # noqa: F722
+    ):
         if drop_audio_cond:
             cond = torch.zeros_like(cond)
         x = torch.cat((x, cond), dim=-1)
         x = self.linear(x)
-        x = self.conv_pos_embed(x) + x
+        x = self.conv_pos_embed(x, mask=audio_mask) + x
         return x
 
 
@@ -101,7 +109,6 @@ class MMDiT(nn.Module):
 
         self.time_embed = TimestepEmbedding(dim)
         self.text_embed = TextEmbedding(dim, text_num_embeds, mask_padding=text_mask_padding)
-        self.text_cond, self.text_uncond = None, None  # text cache
         self.audio_embed = AudioEmbedding(mel_dim, dim)
 
         self.rotary_embed = RotaryEmbedding(dim_head)
@@ -142,8 +149,47 @@ class MMDiT(nn.Module):
         nn.init.constant_(self.proj_out.weight, 0)
         nn.init.constant_(self.proj_out.bias, 0)
 
-    def clear_cache(self):
-        self.text_cond, self.text_uncond = None, None
+    def get_input_embed(
+        self,
+        x,  # b n d
+        cond,  # b n d
+        text,  # b nt
+        drop_audio_cond: bool = False,
+        drop_text: bool = False,
+        cache: SampleCache | None = None,
+        audio_mask: bool["b n"] | None = None,  # noqa: F722
+    ):
+        if cache is not None:
+            if drop_text:
+                if cache.text_uncond is None:
+                    cache.text_uncond = self.text_embed(text, drop_text=True)
+                c = cache.text_uncond
+            else:
+                if cache.text_cond is None:
+                    cache.text_cond = self.text_embed(text, drop_text=False)
+                c = cache.text_cond
+        else:
+            c = self.text_embed(text, drop_text=drop_text)
+
+        x = self.audio_embed(x, cond, drop_audio_cond=drop_audio_cond, audio_mask=audio_mask)
+
+        return x, c
+
+    def precompute_time_cond(self, time: float["s"]):  # noqa: F821
+        # time embedding and all adaln modulations for the known ode time steps, one matmul per layer
+        t = self.time_embed(time)
+        t_mods_c = [block.attn_norm_c.linear(block.attn_norm_c.silu(t)) for block in self.transformer_blocks]
+        t_mods_x = [block.attn_norm_x.linear(block.attn_norm_x.silu(t)) for block in self.transformer_blocks]
+        t_mod_final = self.norm_out.linear(self.norm_out.silu(t))
+        return TimeCondCache(time, t, t_mod_final, *t_mods_c, *t_mods_x)
+
+    def get_time_cond(self, time: float["b"], cache: SampleCache | None = None):  # noqa: F821
+        if cache is not None and cache.time_cond is not None:
+            time_cond = cache.time_cond.lookup(time)
+            if time_cond is not None:
+                t, t_mod_final, *t_mods = time_cond
+                return t, t_mod_final, t_mods[: self.depth], t_mods[self.depth :]
+        return self.time_embed(time), None, [None] * self.depth, [None] * self.depth
 
     def forward(
         self,
@@ -151,39 +197,47 @@ class MMDiT(nn.Module):
         cond: float["b n d"],  # masked cond audio  # noqa: F722
         text: int["b nt"],  # text  # noqa: F722
         time: float["b"] | float[""],  # time step  # noqa: F821 F722
-        drop_audio_cond,  # cfg for cond audio
-        drop_text,  # cfg for text
+        drop_audio_cond: bool = False,  # cfg for cond audio
+        drop_text: bool = False,  # cfg for text
         mask: bool["b n"] | None = None,  # noqa: F722
-        cache=False,
+        cache: SampleCache | None = None,  # per-call sampling cache, created by CFM.sample
+        cfg_infer: bool = False,  # cfg inference, pack cond & uncond forward
     ):
         batch = x.shape[0]
         if time.ndim == 0:
             time = time.repeat(batch)
 
         # t: conditioning (time), c: context (text + masked cond audio), x: noised input audio
-        t = self.time_embed(time)
-        if cache:
-            if drop_text:
-                if self.text_uncond is None:
-                    self.text_uncond = self.text_embed(text, drop_text=True)
-                c = self.text_uncond
-            else:
-                if self.text_cond is None:
-                    self.text_cond = self.text_embed(text, drop_text=False)
-                c = self.text_cond
+        t, t_mod_final, t_mods_c, t_mods_x = self.get_time_cond(time, cache)
+        if cfg_infer:  # pack cond & uncond forward: b n d -> 2b n d
+            x_cond, c_cond = self.get_input_embed(
+                x, cond, text, drop_audio_cond=False, drop_text=False, cache=cache, audio_mask=mask
+            )
+            x_uncond, c_uncond = self.get_input_embed(
+                x, cond, text, drop_audio_cond=True, drop_text=True, cache=cache, audio_mask=mask
+            )
+            x = torch.cat((x_cond, x_uncond), dim=0)
+            c = torch.cat((c_cond, c_uncond), dim=0)
+            t = torch.cat((t, t), dim=0)
+            if t_mod_final is not None:
+                t_mod_final = torch.cat((t_mod_final, t_mod_final), dim=0)
+                t_mods_c = [torch.cat((t_mod, t_mod), dim=0) for t_mod in t_mods_c]
+                t_mods_x = [torch.cat((t_mod, t_mod), dim=0) for t_mod in t_mods_x]
+            mask = torch.cat((mask, mask), dim=0) if mask is not None else None
         else:
-            c = self.text_embed(text, drop_text=drop_text)
-        x = self.audio_embed(x, cond, drop_audio_cond=drop_audio_cond)
+            x, c = self.get_input_embed(
+                x, cond, text, drop_audio_cond=drop_audio_cond, drop_text=drop_text, cache=cache, audio_mask=mask
+            )
 
         seq_len = x.shape[1]
         text_len = text.shape[1]
         rope_audio = self.rotary_embed.forward_from_seq_len(seq_len)
         rope_text = self.rotary_embed.forward_from_seq_len(text_len)
 
-        for block in self.transformer_blocks:
-            c, x = block(x, c, t, mask=mask, rope=rope_audio, c_rope=rope_text)
+        for block, t_mod_c, t_mod_x in zip(self.transformer_blocks, t_mods_c, t_mods_x):
+            c, x = block(x, c, t, mask=mask, rope=rope_audio, c_rope=rope_text, t_mod_c=t_mod_c, t_mod_x=t_mod_x)
 
-        x = self.norm_out(x, t)
+        x = self.norm_out(x, t, emb_mod=t_mod_final)
         output = self.proj_out(x)
 
         return output
@@ -24,6 +24,8 @@ from f5_tts.model.modules import (
     Attention,
     AttnProcessor,
     FeedForward,
+    TimeCondCache,
+    SampleCache,
     precompute_freqs_cis,
     get_pos_embed_indices,
 )
@@ -88,15 +90,34 @@ class TextEmbedding(nn.Module):
 class InputEmbedding(nn.Module):
     def __init__(self, mel_dim, text_dim, out_dim):
         super().__init__()
+        self.mel_dim = mel_dim
         self.proj = nn.Linear(mel_dim * 2 + text_dim, out_dim)
         self.conv_pos_embed = ConvPositionEmbedding(dim=out_dim)
 
-    def forward(self, x: float["b n d"], cond: float["b n d"], text_embed: float["b n d"], drop_audio_cond=False):  # noqa: F722
+    def embed_cond(self, cond: float["b n d"], text_embed: float["b n d"], drop_audio_cond=False):  # noqa: F722
+        # step-invariant part of the input projection (cond audio & text), reusable across all ode steps
         if drop_audio_cond:  # cfg for cond audio
             cond = torch.zeros_like(cond)
 
-        x = self.proj(torch.cat((x, cond, text_embed), dim=-1))
-        x = self.conv_pos_embed(x) + x
+        return F.linear(torch.cat((cond, text_embed), dim=-1), self.proj.weight[:, self.mel_dim :], self.proj.bias)
+
+    def forward(
+        self,
+        x: float["b n d"],  # noqa: F722
+        cond: float["b n d"],  # noqa: F722
+        text_embed: float["b n d"],  # noqa: F722
+        drop_audio_cond=False,
+        cond_embed: float["b n d"] | None = None,  # precomputed with embed_cond()  # noqa: F722
+        audio_mask: bool["b n"] | None = None,  # noqa: F722
+    ):
+        if cond_embed is not None:  # only noised audio x changes between steps
+            x = F.linear(x, self.proj.weight[:, : self.mel_dim]) + cond_embed
+        else:
+            if drop_audio_cond:  # cfg for cond audio
+                cond = torch.zeros_like(cond)
+
+            x = self.proj(torch.cat((x, cond, text_embed), dim=-1))
+        x = self.conv_pos_embed(x, mask=audio_mask) + x
         return x
 
 
@@ -120,6 +141,7 @@ class UNetT(nn.Module):
         qk_norm=None,
         conv_layers=0,
         pe_attn_head=None,
+        attn_chunk_size=None,  # attention in query blocks, bounds memory for long inputs, see AttnProcessor
         skip_connect_type: Literal["add", "concat", "none"] = "concat",
     ):
         super().__init__()
@@ -131,7 +153,6 @@ class UNetT(nn.Module):
         self.text_embed = TextEmbedding(
             text_num_embeds, text_dim, mask_padding=text_mask_padding, conv_layers=conv_layers
         )
-        self.text_cond, self.text_uncond = None, None  # text cache
         self.input_embed = InputEmbedding(mel_dim, text_dim, dim)
 
         self.rotary_embed = RotaryEmbedding(dim_head)
@@ -150,7 +171,7 @@ class UNetT(nn.Module):
 
             attn_norm = RMSNorm(dim)
             attn = Attention(
-                processor=AttnProcessor(pe_attn_head=pe_attn_head),
+                processor=AttnProcessor(pe_attn_head=pe_attn_head, chunk_size=attn_chunk_size),
                 dim=dim,
                 heads=heads,
                 dim_head=dim_head,
@@ -178,8 +199,45 @@ class UNetT(nn.Module):
         self.norm_out = RMSNorm(dim)
         self.proj_out = nn.Linear(dim, mel_dim)
 
-    def clear_cache(self):
-        self.text_cond, self.text_uncond = None, None
+    def get_input_embed(
+        self,
+        x,  # b n d
+        cond,  # b n d
+        text,  # b nt
+        drop_audio_cond: bool = False,
+        drop_text: bool = False,
+        cache: SampleCache | None = None,
+        audio_mask: bool["b n"] | None = None,  # noqa: F722
+    ):
+        seq_len = x.shape[1]
+        if cache is not None:  # text and cond audio are fixed during sampling, cache the step-invariant projection
+            if drop_text:
+                if cache.text_uncond is None:
+                    text_embed = self.text_embed(text, seq_len, drop_text=True)
+                    cache.text_uncond = self.input_embed.embed_cond(cond, text_embed, drop_audio_cond=drop_audio_cond)
+                cond_embed = cache.text_uncond
+            else:
+                if cache.text_cond is None:
+                    text_embed = self.text_embed(text, seq_len, drop_text=False)
+                    cache.text_cond = self.input_embed.embed_cond(cond, text_embed, drop_audio_cond=drop_audio_cond)
+                cond_embed = cache.text_cond
+            x = self.input_embed(x, cond, None, cond_embed=cond_embed, audio_mask=audio_mask)
+        else:
+            text_embed = self.text_embed(text, seq_len, drop_text=drop_text)
+            x = self.input_embed(x, cond, text_embed, drop_audio_cond=drop_audio_cond, audio_mask=audio_mask)
+
+        return x
+
+    def precompute_time_cond(self, time: float["s"]):  # noqa: F821
+        # time embedding for the known ode time steps, no adaln in unett as t is packed into x as a token
+        return TimeCondCache(time, self.time_embed(time))
+
+    def get_time_cond(self, time: float["b"], cache: SampleCache | None = None):  # noqa: F821
+        if cache is not None and cache.time_cond is not None:
+            time_cond = cache.time_cond.lookup(time)
+            if time_cond is not None:
+                return time_cond[0]
+        return self.time_embed(time)
 
     def forward(
         self,
@@ -187,29 +245,32 @@ class UNetT(nn.Module):
         cond: float["b n d"],  # masked cond audio  # noqa: F722
         text: int["b nt"],  # text  # noqa: F722
         time: float["b"] | float[""],  # time step  # noqa: F821 F722
-        drop_audio_cond,  # cfg for cond audio
-        drop_text,  # cfg for text
+        drop_audio_cond: bool = False,  # cfg for cond audio
+        drop_text: bool = False,  # cfg for text
         mask: bool["b n"] | None = None,  # noqa: F722
-        cache=False,
+        cache: SampleCache | None = None,  # per-call sampling cache, created by CFM.sample
+        cfg_infer: bool = False,  # cfg inference, pack cond & uncond forward
     ):
         batch, seq_len = x.shape[0], x.shape[1]
         if time.ndim == 0:
             time = time.repeat(batch)
 
         # t: conditioning time, c: context (text + masked cond audio), x: noised input audio
-        t = self.time_embed(time)
-        if cache:
-            if drop_text:
-                if self.text_uncond is None:
-                    self.text_uncond = self.text_embed(text, seq_len, drop_text=True)
-                text_embed = self.text_uncond
-            else:
-                if self.text_cond is None:
-                    self.text_cond = self.text_embed(text, seq_len, drop_text=False)
-                text_embed = self.text_cond
+        t = self.get_time_cond(time, cache)
+        if cfg_infer:  # pack cond & uncond forward: b n d -> 2b n d
+            x_cond = self.get_input_embed(
+                x, cond, text, drop_audio_cond=False, drop_text=False, cache=cache, audio_mask=mask
+            )
+            x_uncond = self.get_input_embed(
+                x, cond, text, drop_audio_cond=True, drop_text=True, cache=cache, audio_mask=mask
+            )
+            x = torch.cat((x_cond, x_uncond), dim=0)
+            t = torch.cat((t, t), dim=0)
+            mask = torch.cat((mask, mask), dim=0) if mask is not None else None
         else:
-            text_embed = self.text_embed(text, seq_len, drop_text=drop_text)
-        x = self.input_embed(x, cond, text_embed, drop_audio_cond=drop_audio_cond)
+            x = self.get_input_embed(
+                x, cond, text, drop_audio_cond=drop_audio_cond, drop_text=drop_text, cache=cache, audio_mask=mask
+            )
 
         # postfix time t to input x, [b n d] -> [b n+1 d]
         x = torch.cat([t.unsqueeze(1), x], dim=1)  # pack t to x
@@ -9,6 +9,9 @@ d - dimension
 
 from __future__ import annotations
 
+import math
+import os
+from contextlib import nullcontext
 from random import random
 from typing import Callable
 
@@ -18,7 +21,7 @@ from torch import nn
 from torch.nn.utils.rnn import pad_sequence
 from torchdiffeq import odeint
 
-from f5_tts.model.modules import MelSpec
+from f5_tts.model.modules import MelSpec, SampleCache, SampleWorkspace
 from f5_tts.model.utils import (
     default,
     exists,
@@ -29,6 +32,159 @@ from f5_tts.model.utils import (
 )
 
 
+# fixed grid ode solvers, yield the state after each step and keep nothing else, see CFM.sample()
+# nfe_per_step: number of flow predictions per step, time_fracs: where in [t0, t1] the flow is evaluated
+
+
+ODE_SOLVERS = {}
+
+
+def register_ode_solver(name: str, nfe_per_step: int = 1, time_fracs: tuple[float, ...] = (0.0,)):
+    def decorator(solver):
+        solver.nfe_per_step = nfe_per_step
+        solver.time_fracs = time_fracs
+        ODE_SOLVERS[name] = solver
+        return solver
+
+    return decorator
+
+
+def get_solver_time_steps(solver, t: float["n"]) -> float["m"]:  # noqa: F821
+    # all time steps the solver will evaluate the flow at, computed as in the solvers (same float rounding)
+    t0, dt = t[:-1], t[1:] - t[:-1]
+    time_steps = [t0 if frac == 0 else t[1:] if frac == 1 else t0 + dt * frac for frac in solver.time_fracs]
+    return torch.unique(torch.cat(time_steps))
+
+
+@register_ode_solver("euler")
+def euler_solver(fn, y0, t, inplace=False):  # inplace updates y0, for a reused state buffer
+    y = y0
+    for t0, t1 in zip(t[:-1], t[1:]):
+        dt = t1 - t0
+        y = y.addcmul_(fn(t0, y), dt) if inplace else y + dt * fn(t0, y)
+        yield y
+
+
+@register_ode_solver("heun", nfe_per_step=2, time_fracs=(0.0, 1.0))
+def heun_solver(fn, y0, t):
+    y = y0
+    for t0, t1 in zip(t[:-1], t[1:]):
+        dt = t1 - t0
+        k1 = fn(t0, y)
+        k2 = fn(t1, y + dt * k1)
+        y = y + (k1 + k2) * dt * 0.5
+        yield y
+
+
+@register_ode_solver("midpoint", nfe_per_step=2, time_fracs=(0.0, 0.5))
+def midpoint_solver(fn, y0, t):
+    y = y0
+    for t0, t1 in zip(t[:-1], t[1:]):
+        dt = t1 - t0
+        y_mid = y + fn(t0, y) * dt * 0.5
+        y = y + dt * fn(t0 + dt * 0.5, y_mid)
+        yield y
+
+
+@register_ode_solver("rk4", nfe_per_step=4, time_fracs=(0.0, 1 / 3, 2 / 3, 1.0))
+def rk4_solver(fn, y0, t):  # 3/8 rule, as torchdiffeq "rk4"
+    y = y0
+    for t0, t1 in zip(t[:-1], t[1:]):
+        dt = t1 - t0
+        k1 = fn(t0, y)
+        k2 = fn(t0 + dt * (1 / 3), y + dt * k1 * (1 / 3))
+        k3 = fn(t0 + dt * (2 / 3), y + dt * (k2 - k1 * (1 / 3)))
+        k4 = fn(t1, y + dt * (k1 - k2 + k3))
+        y = y + (k1 + 3 * (k2 + k3) + k4) * dt * 0.125
+        yield y
+
+
+@register_ode_solver("adams_bashforth")
+def adams_bashforth_solver(fn, y0, t):  # 2nd order, variable step, reuse the previous flow prediction
+    y, v_prev, dt_prev = y0, None, None
+    for t0, t1 in zip(t[:-1], t[1:]):
+        dt = t1 - t0
+        v = fn(t0, y)
+        if v_prev is None:
+            y = y + dt * v
+        else:
+            ratio = dt / (2 * dt_prev)
+            y = y + dt * ((1 + ratio) * v - ratio * v_prev)
+        v_prev, dt_prev = v, dt
+        yield y
+
+
+def half_log_snr(t: float) -> float:  # lambda_t = log(alpha_t / sigma_t), alpha_t = t, sigma_t = 1 - t
+    if t <= 0:
+        return -math.inf
+    if t >= 1:
+        return math.inf
+    return math.log(t / (1 - t))
+
+
+@register_ode_solver("dpmpp_2m")
+def dpmpp_2m_solver(fn, y0, t):  # dpm-solver++(2m), multistep on data prediction x1 = x + (1 - t) * flow
+    y, d_prev, h_prev = y0, None, None
+    t_list = t.tolist()
+    for t0, s, u in zip(t[:-1], t_list[:-1], t_list[1:]):
+        d = y + (1 - s) * fn(t0, y)
+        h = half_log_snr(u) - half_log_snr(s)
+        # first order (equals euler) on the first two steps, as lambda_0 is -inf so the first step size h_prev is
+        # too, and on the last one as lambda_1 is inf. at 4 nfe only one step gets the multistep correction
+        d_hat = d
+        if d_prev is not None and math.isfinite(h) and math.isfinite(h_prev):
+            r = h_prev / h
+            d_hat = (1 + 1 / (2 * r)) * d - (1 / (2 * r)) * d_prev
+        y = (1 - u) / (1 - s) * y + (u - s) / (1 - s) * d_hat
+        d_prev, h_prev = d, h
+        yield y
+
+
+# classifier-free guidance schedule, which steps run the uncond pass and with what strength
+
+
+def get_cfg_schedule(
+    cfg_strength: float | list[float],  # a constant, or one value per step
+    cfg_schedule: str | None,  # None for every step | "first:k" for first k steps | "every:n" for every n-th step
+    steps: int,
+) -> list[tuple[float, bool]]:
+    if isinstance(cfg_strength, torch.Tensor):
+        cfg_strength = cfg_strength.tolist()
+    if isinstance(cfg_strength, (int, float)):
+        strengths = [float(cfg_strength)] * steps
+    else:
+        strengths = [float(s) for s in cfg_strength]
+        if len(strengths) != steps:
+            raise ValueError(f"Got {len(strengths)} per-step cfg_strength values for {steps} steps.")
+
+    if cfg_schedule is None:
+        run_uncond = [True] * steps
+    else:
+        kind, _, value = cfg_schedule.partition(":")
+        if kind == "first":
+            run_uncond = [i < int(value) for i in range(steps)]
+        elif kind == "every":
+            run_uncond = [i % int(value) == 0 for i in range(steps)]
+        else:
+            raise ValueError(f"Unknown cfg_schedule: {cfg_schedule}, expected 'first:k' or 'every:n'")
+
+    return [(strength, run and strength >= 1e-5) for strength, run in zip(strengths, run_uncond)]
+
+
+# frame padding, to the bucketed length in sample() and into the reused sample workspace
+
+
+def pad_frames(x: torch.Tensor, length: int, value=0, workspace: SampleWorkspace | None = None, name=None):
+    # pad (or cut) the frame dim to length, into a reused workspace buffer if given
+    if not exists(workspace):
+        return F.pad(x, (0, 0) * (x.ndim - 2) + (0, length - x.shape[1]), value=value)
+    out = workspace.get(name, (x.shape[0], length, *x.shape[2:]), x.dtype, x.device)
+    n = min(x.shape[1], length)
+    out[:, :n].copy_(x[:, :n])
+    out[:, n:].fill_(value)
+    return out
+
+
 class CFM(nn.Module):
     def __init__(
         self,
@@ -74,10 +230,72 @@ class CFM(nn.Module):
         # vocab map for tokenization
         self.vocab_char_map = vocab_char_map
 
+        # compiled inference, see compile_transformer()
+        self.frame_bucket = None
+        self.batch_buckets = None
+
+        # mixed precision inference, e.g. torch.bfloat16 on cpu, transformer under autocast over fp32 weights
+        self.autocast_dtype = None
+
     @property
     def device(self):
         return next(self.parameters()).device
 
+    def autocast(self):
+        # only built when asked for, so the default full precision path works where autocast lacks the device type
+        if not exists(self.autocast_dtype):
+            return nullcontext()
+        return torch.autocast(device_type=self.device.type, dtype=self.autocast_dtype)
+
+    def compile_transformer(
+        self,
+        frame_bucket: int = 128,  # sampling length rounded up to multiples of it, extra frames masked out
+        max_duration: int = 4096,
+        batch_sizes: tuple[int, ...] = (1, 2, 4),  # batch rounded up to one of them, larger batches are rejected
+        cache_dir: str | None = None,  # keep inductor compile artifacts on disk, for fast later process starts
+        **compile_kwargs,
+    ):
+        # opt-in, inference only. static shapes so the adaln / gelu / layernorm chains get fused,
+        # while bucketing keeps it to a few graphs instead of one per text length
+        import torch._dynamo.config
+        import torch._inductor.config
+
+        from f5_tts.model.backbones.mmdit import MMDiT
+
+        if isinstance(self.transformer, MMDiT):
+            # text is a sequence of its own there, padding it to the frame bucket would change and slow attention
+            raise ValueError("Compiled sampling is not supported by MMDiT backbone, text lengths are not bucketed.")
+
+        if exists(cache_dir):
+            os.environ["TORCHINDUCTOR_CACHE_DIR"] = cache_dir
+            torch._inductor.config.fx_graph_cache = True
+        # one graph per frame bucket and batch size, for each of cond-only / packed cfg forward. past the limit
+        # dynamo would silently fall back to eager
+        num_graphs = 2 * math.ceil(max_duration / frame_bucket) * len(batch_sizes)
+        torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, num_graphs + 8)
+        if hasattr(torch._dynamo.config, "accumulated_cache_size_limit"):
+            torch._dynamo.config.accumulated_cache_size_limit = max(
+                torch._dynamo.config.accumulated_cache_size_limit, 2 * num_graphs
+            )
+
+        self.frame_bucket = frame_bucket
+        self.batch_buckets = sorted(batch_sizes)
+        # in place on forward, so the state dict keys stay the same
+        self.transformer.forward = torch.compile(self.transformer.forward, dynamic=False, **compile_kwargs)
+
+    @torch.no_grad()
+    def warm_up(self, max_duration: int = 4096):
+        # compile all frame buckets and batch sizes up front, for both the cond-only and the packed cfg forward
+        assert exists(self.frame_bucket), "call compile_transformer() first"
+        device = self.device
+        for batch_size in self.batch_buckets:
+            cond = torch.zeros(batch_size, 1, self.num_channels, device=device)
+            text = torch.zeros(batch_size, 1, dtype=torch.long, device=device)
+            for duration in range(self.frame_bucket, max_duration + 1, self.frame_bucket):
+                self.sample(
+                    cond, text, duration, steps=2, cfg_strength=2.0, cfg_schedule="every:2", max_duration=duration
+                )
+
     @torch.no_grad()
     def sample(
         self,
@@ -87,8 +305,14 @@ class CFM(nn.Module):
         *,
         lens: int["b"] | None = None,  # noqa: F821
         steps=32,
-        cfg_strength=1.0,
+        ode_method: str | None = None,  # see ODE_SOLVERS, default to odeint_kwargs["method"]
+        cfg_strength: float | list[float] = 1.0,
+        cfg_schedule: str | None = None,  # steps to run the uncond pass on, see get_cfg_schedule()
+        cfg_skip_mode: str = "reuse",  # on skipped steps, "reuse" last (pred - null_pred) | "none" for no guidance
         sway_sampling_coef=None,
+        block_cache_threshold: float | None = None,  # reuse deep block outputs across steps, DiT only
+        block_cache_stats: dict | None = None,  # filled with evaluated & skipped block counts
+        workspace: SampleWorkspace | None = None,  # reuse input-side buffers & ode state across calls
         seed: int | None = None,
         max_duration=4096,
         vocoder: Callable[[float["b d n"]], float["b nw"]] | None = None,  # noqa: F722
@@ -96,6 +320,7 @@ class CFM(nn.Module):
         duplicate_test=False,
         t_inter=0.1,
         edit_mask=None,
+        return_trajectory=False,  # keep all intermediate states [steps+1, b, n, d], for debugging
     ):
         self.eval()
         # raw wave
@@ -133,54 +358,112 @@ class CFM(nn.Module):
             torch.maximum((text != -1).sum(dim=-1), lens) + 1, duration
         )  # duration at least text/audio prompt length plus one token, so something is generated
         duration = duration.clamp(max=max_duration)
-        max_duration = duration.amax()
+
+        out_batch = batch
+        if exists(self.batch_buckets):  # compiled, round up to a precompiled batch size, repeating the last item
+            batch = next((size for size in self.batch_buckets if size >= out_batch), None)
+            if batch is None:
+                raise ValueError(
+                    f"Batch of {out_batch} exceeds the largest compiled batch size {self.batch_buckets[-1]}"
+                )
+            index = torch.arange(batch, device=device).clamp(max=out_batch - 1)
+            cond, text, lens, duration, cond_mask = (x[index] for x in (cond, text, lens, duration, cond_mask))
+
+        max_duration = out_duration = duration.amax()
+        if exists(self.frame_bucket):  # compiled, round up to a precompiled length, extra frames are masked out
+            max_duration = (max_duration + self.frame_bucket - 1) // self.frame_bucket * self.frame_bucket
 
         # duplicate test corner for inner time step oberservation
         if duplicate_test:
             test_cond = F.pad(cond, (0, 0, cond_seq_len, max_duration - 2 * cond_seq_len), value=0.0)
 
-        cond = F.pad(cond, (0, 0, 0, max_duration - cond_seq_len), value=0.0)
+        max_duration = int(max_duration)
+        if exists(self.frame_bucket):  # text curtailed / filler padded to seq len in the text embedding anyway,
+            # so the same done here is exact, and keeps the text shape fixed per bucket
+            text = F.pad(text[:, :max_duration], (0, max(0, max_duration - text.shape[1])), value=-1)
+        cond = pad_frames(cond, max_duration, 0.0, workspace, "cond")
         if no_ref_audio:
-            cond = torch.zeros_like(cond)
+            cond = cond.zero_() if exists(workspace) else torch.zeros_like(cond)
 
-        cond_mask = F.pad(cond_mask, (0, max_duration - cond_mask.shape[-1]), value=False)
+        cond_mask = pad_frames(cond_mask, max_duration, False, workspace, "cond_mask")
         cond_mask = cond_mask.unsqueeze(-1)
-        step_cond = torch.where(
-            cond_mask, cond, torch.zeros_like(cond)
-        )  # allow direct control (cut cond audio) with lens passed in
+        # allow direct control (cut cond audio) with lens passed in
+        if exists(workspace):
+            step_cond = torch.mul(cond, cond_mask, out=workspace.get("step_cond", cond.shape, cond.dtype, device))
+        else:
+            step_cond = torch.where(cond_mask, cond, torch.zeros_like(cond))
 
-        if batch > 1:
-            mask = lens_to_mask(duration)
+        if batch > 1 or exists(self.frame_bucket):
+            mask = lens_to_mask(duration, length=max_duration)
         else:  # save memory and speed up, as single inference need no mask currently
             mask = None
 
         # neural ode
 
+        cache = SampleCache()  # step-invariant conditioning of this call only, so the model stays reentrant
+        autocast = self.autocast()
+        step = 0  # current solver step, for the guidance schedule
+        null_delta = None  # last (pred - null_pred), for steps skipping the uncond pass
+
         def fn(t, x):
+            nonlocal null_delta
             # at each step, conditioning is fixed
             # step_cond = torch.where(cond_mask, cond, torch.zeros_like(cond))
 
-            # predict flow
-            pred = self.transformer(
-                x=x, cond=step_cond, text=text, time=t, mask=mask, drop_audio_cond=False, drop_text=False, cache=True
-            )
-            if cfg_strength < 1e-5:
-                return pred
-
-            null_pred = self.transformer(
-                x=x, cond=step_cond, text=text, time=t, mask=mask, drop_audio_cond=True, drop_text=True, cache=True
-            )
-            return pred + (pred - null_pred) * cfg_strength
+            strength, run_uncond = cfg_steps[min(step, len(cfg_steps) - 1)]
+
+            # predict flow (cond)
+            if not run_uncond:
+                with autocast:
+                    pred = self.transformer(
+                        x=x,
+                        cond=step_cond,
+                        text=text,
+                        time=t,
+                        mask=mask,
+                        drop_audio_cond=False,
+                        drop_text=False,
+                        cache=cache,
+                    )
+                pred = pred.to(x.dtype)  # ode state stays in full precision under autocast
+                if strength < 1e-5 or cfg_skip_mode == "none" or null_delta is None:
+                    return pred
+                return pred + null_delta * strength
+
+            # predict flow (cond and uncond), for classifier-free guidance
+            # packed along batch dim into one forward, to halve per-step launch and python overhead
+            with autocast:
+                pred_cfg = self.transformer(
+                    x=x,
+                    cond=step_cond,
+                    text=text,
+                    time=t,
+                    mask=mask,
+                    cfg_infer=True,
+                    cache=cache,
+                )
+            pred, null_pred = torch.chunk(pred_cfg.to(x.dtype), 2, dim=0)
+            null_delta = pred - null_pred
+            return pred + null_delta * strength
 
         # noise input
         # to make sure batch inference result is same with different batch size, and for sure single inference
         # still some difference maybe due to convolutional layers
-        y0 = []
-        for dur in duration:
-            if exists(seed):
-                torch.manual_seed(seed)
-            y0.append(torch.randn(dur, self.num_channels, device=self.device, dtype=step_cond.dtype))
-        y0 = pad_sequence(y0, padding_value=0, batch_first=True)
+        if exists(workspace):  # same draws as below, written into the reused ode state buffer
+            y0 = workspace.get("y0", (batch, max_duration, self.num_channels), step_cond.dtype, self.device).zero_()
+            for i, dur in enumerate(duration.tolist()):
+                if exists(seed):
+                    torch.manual_seed(seed)
+                y0[i, :dur].normal_()
+        else:
+            y0 = []
+            for dur in duration:
+                if exists(seed):
+                    torch.manual_seed(seed)
+                y0.append(torch.randn(dur, self.num_channels, device=self.device, dtype=step_cond.dtype))
+            y0 = pad_sequence(y0, padding_value=0, batch_first=True)
+            if exists(self.frame_bucket):
+                y0 = F.pad(y0, (0, 0, 0, max_duration - y0.shape[1]), value=0.0)
 
         t_start = 0
 
@@ -194,12 +477,42 @@ class CFM(nn.Module):
         if sway_sampling_coef is not None:
             t = t + sway_sampling_coef * (torch.cos(torch.pi / 2 * t) - 1 + t)
 
-        trajectory = odeint(fn, y0, t, **self.odeint_kwargs)
-        self.transformer.clear_cache()
+        # precompute time conditioning of all time steps the fixed grid solver will evaluate, at once
+        ode_method = default(ode_method, self.odeint_kwargs.get("method", "euler"))
+        solver = ODE_SOLVERS.get(ode_method)
+        time_steps = get_solver_time_steps(solver, t) if exists(solver) else t
+        with autocast:
+            cache.time_cond = self.transformer.precompute_time_cond(time_steps)
+
+        cfg_steps = get_cfg_schedule(cfg_strength, cfg_schedule, steps)
+
+        if exists(block_cache_threshold):
+            if not hasattr(self.transformer, "enable_block_cache"):
+                raise ValueError(f"Block cache is not supported by {type(self.transformer).__name__} backbone.")
+            self.transformer.enable_block_cache(cache, block_cache_threshold)
+
+        if exists(solver):  # only hold the running state unless trajectory asked
+            sampled, trajectory = y0, [y0]
+            # with a workspace, step the ode state in place where the solver supports it
+            inplace = exists(workspace) and solver is euler_solver and not return_trajectory
+            for sampled in solver(fn, y0, t, **(dict(inplace=True) if inplace else {})):
+                step += 1
+                if return_trajectory:
+                    trajectory.append(sampled)
+            trajectory = torch.stack(trajectory) if return_trajectory else None
+        else:  # e.g. adaptive step solvers from torchdiffeq, guidance schedule keeps at its first step
+            trajectory = odeint(fn, y0, t, **{**self.odeint_kwargs, "method": ode_method})
+            sampled = trajectory[-1]
+            if not return_trajectory:
+                trajectory = None
+        if exists(block_cache_stats):
+            block_cache_stats.update(self.transformer.get_block_cache_stats(cache))
 
-        sampled = trajectory[-1]
         out = sampled
         out = torch.where(cond_mask, cond, out)
+        if exists(self.frame_bucket):  # cut the bucket padding
+            out = out[:out_batch, :out_duration]
+            trajectory = trajectory[:, :out_batch, :out_duration] if exists(trajectory) else None
 
         if exists(vocoder):
             out = out.permute(0, 2, 1)
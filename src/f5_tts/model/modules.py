@@ -15,7 +15,6 @@ from typing import Optional
 import torch
 import torch.nn.functional as F
 import torchaudio
-from librosa.filters import mel as librosa_mel_fn
 from torch import nn
 from x_transformers.x_transformers import apply_rotary_pos_emb
 
@@ -42,6 +41,8 @@ def get_bigvgan_mel_spectrogram(
     key = f"{n_fft}_{n_mel_channels}_{target_sample_rate}_{hop_length}_{win_length}_{fmin}_{fmax}_{device}"
 
     if key not in mel_basis_cache:
+        from librosa.filters import mel as librosa_mel_fn  # slow to import, bigvgan only
+
         mel = librosa_mel_fn(sr=target_sample_rate, n_fft=n_fft, n_mels=n_mel_channels, fmin=fmin, fmax=fmax)
         mel_basis_cache[key] = torch.from_numpy(mel).float().to(device)  # TODO: why they need .float()?
         hann_window_cache[key] = torch.hann_window(win_length).to(device)
@@ -156,7 +157,7 @@ class SinusPositionEmbedding(nn.Module):
         half_dim = self.dim // 2
         emb = math.log(10000) / (half_dim - 1)
         emb = torch.exp(torch.arange(half_dim, device=device).float() * -emb)
-        emb = scale * x.unsqueeze(1) * emb.unsqueeze(0)
+        emb = scale * x.float().unsqueeze(1) * emb.unsqueeze(0)  # fp32, scaled time loses precision in half
         emb = torch.cat((emb.sin(), emb.cos()), dim=-1)
         return emb
 
@@ -177,15 +178,18 @@ class ConvPositionEmbedding(nn.Module):
 
     def forward(self, x: float["b n d"], mask: bool["b n"] | None = None):  # noqa: F722
         if mask is not None:
-            mask = mask[..., None]
-            x = x.masked_fill(~mask, 0.0)
+            mask = mask[:, None, :]  # b 1 n, channels first as the convs
 
         x = x.permute(0, 2, 1)
-        x = self.conv1d(x)
-        out = x.permute(0, 2, 1)
+        # padding re-masked before each conv, else it leaks into valid frames at the edge of a padded item
+        for i in range(0, len(self.conv1d), 2):
+            if mask is not None:
+                x = x.masked_fill(~mask, 0.0)
+            x = self.conv1d[i : i + 2](x)  # conv & mish
 
         if mask is not None:
-            out = out.masked_fill(~mask, 0.0)
+            x = x.masked_fill(~mask, 0.0)
+        out = x.permute(0, 2, 1)
 
         return out
 
@@ -307,8 +311,10 @@ class AdaLayerNorm(nn.Module):
 
         self.norm = nn.LayerNorm(dim, elementwise_affine=False, eps=1e-6)
 
-    def forward(self, x, emb=None):
-        emb = self.linear(self.silu(emb))
+    def forward(self, x, emb=None, emb_mod=None):  # emb_mod: precomputed linear(silu(emb)), see TimeCondCache
+        if emb_mod is None:
+            emb_mod = self.linear(self.silu(emb))
+        emb = emb_mod
         shift_msa, scale_msa, gate_msa, shift_mlp, scale_mlp, gate_mlp = torch.chunk(emb, 6, dim=1)
 
         x = self.norm(x) * (1 + scale_msa[:, None]) + shift_msa[:, None]
@@ -328,8 +334,10 @@ class AdaLayerNorm_Final(nn.Module):
 
         self.norm = nn.LayerNorm(dim, elementwise_affine=False, eps=1e-6)
 
-    def forward(self, x, emb):
-        emb = self.linear(self.silu(emb))
+    def forward(self, x, emb=None, emb_mod=None):  # emb_mod: precomputed linear(silu(emb)), see TimeCondCache
+        if emb_mod is None:
+            emb_mod = self.linear(self.silu(emb))
+        emb = emb_mod
         scale, shift = torch.chunk(emb, 2, dim=1)
 
         x = self.norm(x) * (1 + scale)[:, None, :] + shift[:, None, :]
@@ -436,8 +444,10 @@ class AttnProcessor:
     def __init__(
         self,
         pe_attn_head: int | None = None,  # number of attention head to apply rope, None for all
+        chunk_size: int | None = None,  # attend in query blocks of this size, None for all queries at once
     ):
         self.pe_attn_head = pe_attn_head
+        self.chunk_size = chunk_size
 
     def __call__(
         self,
@@ -481,13 +491,23 @@ class AttnProcessor:
 
         # mask. e.g. inference got a batch with different target durations, mask out the padding
         if mask is not None:
-            attn_mask = mask
-            attn_mask = attn_mask.unsqueeze(1).unsqueeze(1)  # 'b n -> b 1 1 n'
-            attn_mask = attn_mask.expand(batch_size, attn.heads, query.shape[-2], key.shape[-2])
+            # key padding only, keep it broadcastable over heads & queries rather than expanded to b h n n,
+            # so sdpa can still take the memory-efficient kernel instead of the math one
+            attn_mask = mask.unsqueeze(1).unsqueeze(1)  # 'b n -> b 1 1 n'
         else:
             attn_mask = None
 
-        x = F.scaled_dot_product_attention(query, key, value, attn_mask=attn_mask, dropout_p=0.0, is_causal=False)
+        if self.chunk_size is not None and query.shape[-2] > self.chunk_size:
+            # each query block still attends to all keys, so its softmax is exact, while the score matrix
+            # (math kernel on cpu) is at most b h chunk n instead of b h n n
+            x = torch.empty_like(query)
+            for start in range(0, query.shape[-2], self.chunk_size):
+                end = start + self.chunk_size
+                x[:, :, start:end] = F.scaled_dot_product_attention(
+                    query[:, :, start:end], key, value, attn_mask=attn_mask, dropout_p=0.0, is_causal=False
+                )
+        else:
+            x = F.scaled_dot_product_attention(query, key, value, attn_mask=attn_mask, dropout_p=0.0, is_causal=False)
         x = x.transpose(1, 2).reshape(batch_size, -1, attn.heads * head_dim)
         x = x.to(query.dtype)
 
@@ -574,8 +594,7 @@ class JointAttnProcessor:
         # mask. e.g. inference got a batch with different target durations, mask out the padding
         if mask is not None:
             attn_mask = F.pad(mask, (0, c.shape[1]), value=True)  # no mask for c (text)
-            attn_mask = attn_mask.unsqueeze(1).unsqueeze(1)  # 'b n -> b 1 1 n'
-            attn_mask = attn_mask.expand(batch_size, attn.heads, query.shape[-2], key.shape[-2])
+            attn_mask = attn_mask.unsqueeze(1).unsqueeze(1)  # 'b n -> b 1 1 n', broadcast in sdpa
         else:
             attn_mask = None
 
@@ -608,12 +627,14 @@ class JointAttnProcessor:
 
 
 class DiTBlock(nn.Module):
-    def __init__(self, dim, heads, dim_head, ff_mult=4, dropout=0.1, qk_norm=None, pe_attn_head=None):
+    def __init__(
+        self, dim, heads, dim_head, ff_mult=4, dropout=0.1, qk_norm=None, pe_attn_head=None, attn_chunk_size=None
+    ):
         super().__init__()
 
         self.attn_norm = AdaLayerNorm(dim)
         self.attn = Attention(
-            processor=AttnProcessor(pe_attn_head=pe_attn_head),
+            processor=AttnProcessor(pe_attn_head=pe_attn_head, chunk_size=attn_chunk_size),
             dim=dim,
             heads=heads,
             dim_head=dim_head,
@@ -624,9 +645,9 @@ class DiTBlock(nn.Module):
         self.ff_norm = nn.LayerNorm(dim, elementwise_affine=False, eps=1e-6)
         self.ff = FeedForward(dim=dim, mult=ff_mult, dropout=dropout, approximate="tanh")
 
-    def forward(self, x, t, mask=None, rope=None):  # x: noised input, t: time embedding
+    def forward(self, x, t, mask=None, rope=None, t_mod=None):  # x: noised input, t: time embedding
         # pre-norm & modulation for attention input
-        norm, gate_msa, shift_mlp, scale_mlp, gate_mlp = self.attn_norm(x, emb=t)
+        norm, gate_msa, shift_mlp, scale_mlp, gate_mlp = self.attn_norm(x, emb=t, emb_mod=t_mod)
 
         # attention
         attn_output = self.attn(x=norm, mask=mask, rope=rope)
@@ -684,13 +705,15 @@ class MMDiTBlock(nn.Module):
         self.ff_norm_x = nn.LayerNorm(dim, elementwise_affine=False, eps=1e-6)
         self.ff_x = FeedForward(dim=dim, mult=ff_mult, dropout=dropout, approximate="tanh")
 
-    def forward(self, x, c, t, mask=None, rope=None, c_rope=None):  # x: noised input, c: context, t: time embedding
+    def forward(
+        self, x, c, t, mask=None, rope=None, c_rope=None, t_mod_c=None, t_mod_x=None
+    ):  # x: noised input, c: context, t: time embedding
         # pre-norm & modulation for attention input
         if self.context_pre_only:
-            norm_c = self.attn_norm_c(c, t)
+            norm_c = self.attn_norm_c(c, emb=t, emb_mod=t_mod_c)
         else:
-            norm_c, c_gate_msa, c_shift_mlp, c_scale_mlp, c_gate_mlp = self.attn_norm_c(c, emb=t)
-        norm_x, x_gate_msa, x_shift_mlp, x_scale_mlp, x_gate_mlp = self.attn_norm_x(x, emb=t)
+            norm_c, c_gate_msa, c_shift_mlp, c_scale_mlp, c_gate_mlp = self.attn_norm_c(c, emb=t, emb_mod=t_mod_c)
+        norm_x, x_gate_msa, x_shift_mlp, x_scale_mlp, x_gate_mlp = self.attn_norm_x(x, emb=t, emb_mod=t_mod_x)
 
         # attention
         x_attn_output, c_attn_output = self.attn(x=norm_x, c=norm_c, mask=mask, rope=rope, c_rope=c_rope)
@@ -729,3 +752,60 @@ class TimestepEmbedding(nn.Module):
         time_hidden = time_hidden.to(timestep.dtype)
         time = self.time_mlp(time_hidden)  # b d
         return time
+
+
+# time conditioning schedule cache
+# the ode time steps are known before sampling, so the time embedding and every adaln modulation
+# can be computed for all steps at once (one batched matmul per layer), then looked up at each step
+
+
+class TimeCondCache:
+    def __init__(self, time: float["s"], *conds: float["s d"]):  # noqa: F821 F722
+        self.time, order = torch.sort(time)
+        self.conds = [cond[order] for cond in conds]
+
+    def lookup(self, time: float["b"]) -> list[float["b d"]] | None:  # noqa: F821 F722
+        idx = torch.searchsorted(self.time, time).clamp(max=self.time.shape[0] - 1)
+        if not torch.equal(self.time[idx], time):  # time step not precomputed, e.g. adaptive ode solver
+            return None
+        return [cond[idx] for cond in self.conds]
+
+
+# per-call sampling cache
+# created by CFM.sample and passed down to the backbone at each step, nothing is kept on the module,
+# so one loaded model can serve concurrent sample calls
+
+
+class SampleCache:
+    def __init__(self):
+        self.text_cond, self.text_uncond = None, None  # text & cond audio input embedding
+        self.time_cond = None  # time conditioning schedule, TimeCondCache
+        self.block_cache = None  # cross-step deep block outputs, DiT only
+
+
+# sampling workspace
+# opt-in buffer arena reused across sample calls of similar shapes (e.g. a server replaying requests), for the
+# input-side tensors and the ode state. buffers are overwritten by the next call, so one workspace per caller
+
+
+class SampleWorkspace:
+    def __init__(self, max_buffers: int = 32):
+        self.buffers = {}  # (name, shape, dtype, device) -> tensor, in least recently used order
+        self.max_buffers = max_buffers
+        self.allocations, self.reuses = 0, 0
+
+    def get(self, name: str, shape: tuple[int, ...], dtype: torch.dtype, device: torch.device) -> torch.Tensor:
+        key = (name, tuple(shape), dtype, torch.device(device))
+        buffer = self.buffers.pop(key, None)
+        if buffer is None:
+            if len(self.buffers) >= self.max_buffers:
+                del self.buffers[next(iter(self.buffers))]
+            buffer = torch.empty(shape, dtype=dtype, device=device)
+            self.allocations += 1
+        else:
+            self.reuses += 1
+        self.buffers[key] = buffer
+        return buffer
+
+    def clear(self):
+        self.buffers.clear()
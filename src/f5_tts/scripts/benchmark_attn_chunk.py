@@ -0,0 +1,73 @@
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+import argparse
+import multiprocessing as mp
+import resource
+import time
+
+import torch
+
+from f5_tts.model.modules import Attention, AttnProcessor
+
+
+""" full vs query-chunked attention on cpu (F5TTS_v1_Base dims): max abs diff, time and peak rss growth,
+each peak measured in a fresh process as ru_maxrss only ever grows """
+
+parser = argparse.ArgumentParser(description="Compare query-chunked attention against full attention on cpu.")
+parser.add_argument("--chunk_sizes", type=int, nargs="+", default=[256, 512, 1024])
+parser.add_argument("--durations", type=int, nargs="+", default=[10, 20, 40], help="Seconds of audio frames")
+parser.add_argument("--batch_size", type=int, default=2, help="2 for the packed cond & uncond forward")
+parser.add_argument("--repeat", type=int, default=3)
+args = parser.parse_args()
+
+dim, heads, dim_head = 1024, 16, 64
+target_sample_rate = 24000
+hop_length = 256
+
+
+def build(chunk_size):
+    torch.manual_seed(0)
+    return Attention(AttnProcessor(chunk_size=chunk_size), dim=dim, heads=heads, dim_head=dim_head).eval()
+
+
+def inputs(seq_len):
+    torch.manual_seed(1)
+    x = torch.randn(args.batch_size, seq_len, dim)
+    mask = torch.ones(args.batch_size, seq_len, dtype=torch.bool)
+    mask[1:, seq_len * 3 // 4 :] = False  # some padding, as in a mixed length batch
+    return x, mask
+
+
+def measure(seq_len, chunk_size, results):
+    torch.set_grad_enabled(False)
+    attn, (x, mask) = build(chunk_size), inputs(seq_len)
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        attn(x, mask=mask)
+    elapsed = (time.perf_counter() - start) / args.repeat * 1000
+    results.put((elapsed, (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base_rss) / 2**10))  # KiB on linux
+
+
+if __name__ == "__main__":
+    ctx = mp.get_context("spawn")
+    print(f"{'dur (s)':>8}{'frames':>8}{'chunk':>7}{'ms':>10}{'peak +MiB':>11}{'max diff':>10}")
+    for duration in args.durations:
+        seq_len = int(duration * target_sample_rate / hop_length)
+        with torch.no_grad():
+            x, mask = inputs(seq_len)
+            full = build(None)(x, mask=mask)
+            diffs = {size: (build(size)(x, mask=mask) - full).abs().max().item() for size in args.chunk_sizes}
+        del x, mask, full
+
+        for chunk_size in [None] + args.chunk_sizes:
+            results = ctx.Queue()
+            proc = ctx.Process(target=measure, args=(seq_len, chunk_size, results))
+            proc.start()
+            elapsed, peak = results.get()
+            proc.join()
+            diff = f"{diffs[chunk_size]:>10.2e}" if chunk_size is not None else f"{'-':>10}"
+            print(f"{duration:>8}{seq_len:>8}{str(chunk_size or 'full'):>7}{elapsed:>10.1f}{peak:>11.0f}{diff}")
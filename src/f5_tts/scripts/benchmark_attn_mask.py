@@ -0,0 +1,74 @@
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+import time
+
+import torch
+import torch.nn.functional as F
+
+from f5_tts.model.modules import Attention, AttnProcessor
+
+
+""" key padding mask in attention: expanded b h n n mask vs broadcastable b 1 1 n mask (F5TTS_v1_Base dims) """
+
+dim, heads, dim_head = 1024, 16, 64
+target_sample_rate = 24000
+hop_length = 256
+repeat = 10
+
+device = "cuda" if torch.cuda.is_available() else "cpu"
+dtype = torch.float16 if device == "cuda" else torch.float32
+
+torch.set_grad_enabled(False)
+attn = Attention(AttnProcessor(), dim=dim, heads=heads, dim_head=dim_head).to(device, dtype).eval()
+
+
+def expanded_mask_attn(x, mask):
+    # previous path, mask expanded to b h n n before sdpa
+    batch_size = x.shape[0]
+    query = attn.to_q(x).view(batch_size, -1, heads, dim_head).transpose(1, 2)
+    key = attn.to_k(x).view(batch_size, -1, heads, dim_head).transpose(1, 2)
+    value = attn.to_v(x).view(batch_size, -1, heads, dim_head).transpose(1, 2)
+    attn_mask = mask.unsqueeze(1).unsqueeze(1).expand(batch_size, heads, query.shape[-2], key.shape[-2])
+    x = F.scaled_dot_product_attention(query, key, value, attn_mask=attn_mask, dropout_p=0.0, is_causal=False)
+    x = attn.to_out[0](x.transpose(1, 2).reshape(batch_size, -1, heads * dim_head))
+    return x.masked_fill(~mask.unsqueeze(-1), 0.0)
+
+
+def bench(func):
+    func()  # warm-up
+    if device == "cuda":
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    if device == "cuda":
+        torch.cuda.synchronize()
+    peak_mem = torch.cuda.max_memory_allocated() / 2**20 if device == "cuda" else float("nan")
+    return (time.perf_counter() - start) / repeat * 1000, peak_mem
+
+
+print(f"device {device}, dtype {dtype}")
+print(f"{'batch':>5}{'dur (s)':>9}{'expanded ms':>13}{'MiB':>9}{'broadcast ms':>14}{'MiB':>9}{'max diff':>10}")
+for batch in [1, 2, 4, 8, 16]:
+    for duration in [10, 20, 30]:
+        seq_len = int(duration * target_sample_rate / hop_length)
+        x = torch.randn(batch, seq_len, dim, device=device, dtype=dtype)
+        lens = torch.linspace(seq_len // 2, seq_len, batch, device=device).long()  # mixed lengths
+        mask = torch.arange(seq_len, device=device)[None, :] < lens[:, None]
+
+        try:
+            max_diff = (expanded_mask_attn(x, mask) - attn(x, mask=mask)).abs().max().item()
+            expanded_ms, expanded_mem = bench(lambda: expanded_mask_attn(x, mask))
+            broadcast_ms, broadcast_mem = bench(lambda: attn(x, mask=mask))
+        except torch.cuda.OutOfMemoryError:
+            print(f"{batch:>5}{duration:>9} out of memory")
+            torch.cuda.empty_cache()
+            continue
+        print(
+            f"{batch:>5}{duration:>9}{expanded_ms:>13.2f}{expanded_mem:>9.0f}"
+            f"{broadcast_ms:>14.2f}{broadcast_mem:>9.0f}{max_diff:>10.2e}"
+        )
@@ -0,0 +1,150 @@
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+import argparse
+import io
+import multiprocessing as mp
+import resource
+import time
+from importlib.resources import files
+
+import torch
+import torchaudio
+from cached_path import cached_path
+from omegaconf import OmegaConf
+
+from f5_tts.infer.utils_infer import (
+    hop_length,
+    load_model,
+    load_vocoder,
+    prepare_ref_audio,
+    prepare_text_duration,
+    preprocess_ref_audio_text,
+    target_rms,
+    target_sample_rate,
+)
+from f5_tts.model import DiT, UNetT  # noqa: F401. used for config
+
+
+""" reduced precision check on cpu (int8 dynamic quantization, bf16 autocast):
+mel distance to fp32 on a fixed prompt set, rtf, serialized weight size and process memory (rss) growth,
+each mode in a fresh process as freed memory is not returned to the os """
+
+parser = argparse.ArgumentParser(description="Compare int8 quantized and bf16 autocast inference against fp32 on cpu.")
+parser.add_argument("--model", type=str, default="F5TTS_v1_Base")
+parser.add_argument("--ckpt_file", type=str, default="")
+parser.add_argument("--vocab_file", type=str, default="")
+parser.add_argument(
+    "--ref_audio", type=str, default=str(files("f5_tts").joinpath("infer/examples/basic/basic_ref_en.wav"))
+)
+parser.add_argument("--ref_text", type=str, default="Some call me nature, others call me mother nature.")
+parser.add_argument(
+    "--gen_text",
+    type=str,
+    nargs="+",
+    default=[
+        "I don't really care what you call me.",
+        "I've been a silent spectator, watching species evolve, empires rise and fall.",
+        "But always remember, I am mighty and enduring. Respect me and I'll nurture you; ignore me and you shall face "
+        "the consequences.",
+    ],
+)
+parser.add_argument("--nfe_step", type=int, default=32)
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--num_threads", type=int, default=None)
+parser.add_argument("--modes", type=str, nargs="+", default=["int8", "bf16"], choices=["int8", "bf16"])
+args = parser.parse_args()
+
+device = "cpu"
+if args.num_threads is not None:
+    torch.set_num_threads(args.num_threads)
+
+model_cfg = OmegaConf.load(str(files("f5_tts").joinpath(f"configs/{args.model}.yaml"))).model
+model_cls = globals()[model_cfg.backbone]
+ckpt_file = args.ckpt_file or str(cached_path(f"hf://SWivid/F5-TTS/{args.model}/model_1250000.safetensors"))
+mel_spec_type = model_cfg.mel_spec.mel_spec_type
+
+ref_audio, ref_text = preprocess_ref_audio_text(args.ref_audio, args.ref_text)
+audio, _ = prepare_ref_audio(*torchaudio.load(ref_audio), target_rms=target_rms, device=device)
+ref_audio_len = audio.shape[-1] // hop_length
+
+
+def rss_mib():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def weight_size(module):
+    # serialized state dict, counts the packed int8 weights of quantized linears
+    buffer = io.BytesIO()
+    torch.save(module.state_dict(), buffer)
+    return buffer.tell() / 2**20
+
+
+def run(model, vocoder):
+    mels, wall_time, audio_time = [], 0.0, 0.0
+    for gen_text in args.gen_text:
+        text, duration = prepare_text_duration(ref_text, gen_text, ref_audio_len)
+        start = time.perf_counter()
+        with torch.inference_mode():
+            mel, _ = model.sample(
+                cond=audio,
+                text=[text],
+                duration=duration,
+                steps=args.nfe_step,
+                cfg_strength=2.0,
+                sway_sampling_coef=-1,
+                seed=args.seed,
+            )
+            mel = mel[:, ref_audio_len:, :].float()
+            wave = vocoder.decode(mel.permute(0, 2, 1))
+        wall_time += time.perf_counter() - start
+        audio_time += wave.shape[-1] / target_sample_rate
+        mels.append(mel)
+    return mels, wall_time / audio_time
+
+
+def measure(mode, results):
+    base_rss = rss_mib()
+    quantize = "int8" if mode == "int8" else None
+    dtype = "bfloat16" if mode == "bf16" else None
+    model = load_model(
+        model_cls,
+        model_cfg.arch,
+        ckpt_file,
+        mel_spec_type,
+        args.vocab_file,
+        device=device,
+        quantize=quantize,
+        dtype=dtype,
+    )
+    vocoder = load_vocoder(vocoder_name=mel_spec_type, device=device, quantize=quantize)
+    load_rss = rss_mib() - base_rss
+    run(model, vocoder)  # warm-up
+    mels, rtf = run(model, vocoder)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10 - base_rss  # KiB on linux
+    weights = weight_size(model) + weight_size(vocoder)
+    results.put(dict(mels=mels, rtf=rtf, weights_mb=weights, load_rss=load_rss, peak_rss=peak_rss))
+
+
+if __name__ == "__main__":
+    ctx = mp.get_context("spawn")
+    results = {}
+    for mode in ["fp32"] + args.modes:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=measure, args=(mode, queue))
+        proc.start()
+        results[mode] = queue.get()
+        proc.join()
+
+    print(f"{'':<6}{'rtf':>8}{'weights MiB':>13}{'load rss +MiB':>15}{'peak rss +MiB':>15}{'mel l1':>10}{'mel l2':>10}")
+    for name, result in results.items():
+        pairs = list(zip(result["mels"], results["fp32"]["mels"]))
+        l1 = sum((m - r).abs().mean().item() for m, r in pairs) / len(pairs)
+        l2 = sum((m - r).pow(2).mean().sqrt().item() for m, r in pairs) / len(pairs)
+        print(
+            f"{name:<6}{result['rtf']:>8.3f}{result['weights_mb']:>13.1f}{result['load_rss']:>15.1f}"
+            f"{result['peak_rss']:>15.1f}{l1:>10.4f}{l2:>10.4f}"
+        )
@@ -0,0 +1,43 @@
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+import argparse
+import subprocess
+import time
+
+
+""" cold import time of f5_tts entry modules, each in a fresh interpreter, and the packages it is spent in """
+
+parser = argparse.ArgumentParser(description="Cold-import cost of f5_tts modules.")
+parser.add_argument("--modules", type=str, nargs="+", default=["f5_tts.api", "f5_tts.infer.utils_infer"])
+parser.add_argument("--repeat", type=int, default=5)
+parser.add_argument("--top", type=int, default=10, help="Show the slowest packages from python -X importtime")
+args = parser.parse_args()
+
+
+def cold_import(module, importtime=False):
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", f"import {module}"]
+    start = time.perf_counter()
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return time.perf_counter() - start, result.stderr
+
+
+baseline = min(cold_import("sys")[0] for _ in range(args.repeat))  # interpreter startup
+print(f"interpreter startup {baseline:.3f} s, excluded below")
+for module in args.modules:
+    times = sorted(cold_import(module)[0] - baseline for _ in range(args.repeat))
+    print(f"{module}: min {times[0]:.3f} s, median {times[len(times) // 2]:.3f} s")
+
+    # "import time: self [us] | cumulative | imported package", self time summed per top level package
+    _, stderr = cold_import(module, importtime=True)
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+    for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[: args.top]:
+        print(f"    {self_us / 1e6:>7.3f} s  {package}")
@@ -0,0 +1,49 @@
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+import time
+
+import torch
+
+from f5_tts.model.backbones.dit import InputEmbedding
+
+
+""" per-step input projection: full concat path vs cached cond & text path (F5TTS_v1_Base dims) """
+
+mel_dim, text_dim, dim = 100, 512, 1024
+steps = 32
+batch = 2  # cond & uncond packed
+target_sample_rate = 24000
+hop_length = 256
+
+torch.set_grad_enabled(False)
+input_embed = InputEmbedding(mel_dim, text_dim, dim).eval()
+
+
+def bench(func, repeat=steps):
+    func()  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+for duration in [10, 20, 30, 40]:
+    seq_len = int(duration * target_sample_rate / hop_length)
+    x = torch.randn(batch, seq_len, mel_dim)
+    cond = torch.randn(batch, seq_len, mel_dim)
+    text_embed = torch.randn(batch, seq_len, text_dim)
+
+    cond_embed = input_embed.embed_cond(cond, text_embed)
+    full = input_embed(x, cond, text_embed)
+    cached = input_embed(x, cond, None, cond_embed=cond_embed)
+    max_diff = (full - cached).abs().max().item()
+
+    full_ms = bench(lambda: input_embed(x, cond, text_embed))
+    cached_ms = bench(lambda: input_embed(x, cond, None, cond_embed=cond_embed))
+    print(
+        f"{duration:>3d}s ({seq_len} frames): full {full_ms:.2f} ms/step, cached {cached_ms:.2f} ms/step, "
+        f"saving {(1 - cached_ms / full_ms) * 100:.1f}%, max abs diff {max_diff:.2e}"
+    )
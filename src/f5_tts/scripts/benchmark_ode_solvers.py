@@ -0,0 +1,101 @@
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+import argparse
+import time
+from importlib.resources import files
+
+import torch
+import torchaudio
+from cached_path import cached_path
+from omegaconf import OmegaConf
+
+from f5_tts.infer.utils_infer import (
+    hop_length,
+    load_model,
+    prepare_ref_audio,
+    prepare_text_duration,
+    preprocess_ref_audio_text,
+    target_rms,
+)
+from f5_tts.model import DiT, UNetT  # noqa: F401. used for config
+from f5_tts.model.cfm import ODE_SOLVERS
+
+
+""" wall time and mel distance to a 64-step euler reference, for each ode solver at several nfe """
+
+parser = argparse.ArgumentParser(description="Quality vs. NFE benchmark of the CFM ode solvers.")
+parser.add_argument("--model", type=str, default="F5TTS_v1_Base")
+parser.add_argument("--ckpt_file", type=str, default="")
+parser.add_argument("--vocab_file", type=str, default="")
+parser.add_argument(
+    "--ref_audio", type=str, default=str(files("f5_tts").joinpath("infer/examples/basic/basic_ref_en.wav"))
+)
+parser.add_argument("--ref_text", type=str, default="Some call me nature, others call me mother nature.")
+parser.add_argument(
+    "--gen_text",
+    type=str,
+    default="I don't really care what you call me. I've been a silent spectator, watching species evolve.",
+)
+parser.add_argument("--solvers", type=str, nargs="+", default=list(ODE_SOLVERS))
+parser.add_argument("--nfe", type=int, nargs="+", default=[4, 8, 16, 32])
+parser.add_argument("--ref_steps", type=int, default=64)
+parser.add_argument("--cfg_strength", type=float, default=2.0)
+parser.add_argument("--sway_sampling_coef", type=float, default=-1.0)
+parser.add_argument("--block_cache_threshold", type=float, default=None, help="DiT cross-step block cache threshold")
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--device", type=str, default=None)
+args = parser.parse_args()
+
+device = args.device or ("cuda" if torch.cuda.is_available() else "cpu")
+
+model_cfg = OmegaConf.load(str(files("f5_tts").joinpath(f"configs/{args.model}.yaml"))).model
+model_cls = globals()[model_cfg.backbone]
+ckpt_file = args.ckpt_file or str(cached_path(f"hf://SWivid/F5-TTS/{args.model}/model_1250000.safetensors"))
+mel_spec_type = model_cfg.mel_spec.mel_spec_type
+model = load_model(model_cls, model_cfg.arch, ckpt_file, mel_spec_type, args.vocab_file, device=device)
+
+ref_audio, ref_text = preprocess_ref_audio_text(args.ref_audio, args.ref_text)
+audio, _ = prepare_ref_audio(*torchaudio.load(ref_audio), target_rms=target_rms, device=device)
+ref_audio_len = audio.shape[-1] // hop_length
+text, duration = prepare_text_duration(ref_text, args.gen_text, ref_audio_len)
+
+
+def run(ode_method, steps, block_cache_threshold=None, block_cache_stats=None):
+    if device == "cuda":
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    with torch.inference_mode():
+        mel, _ = model.sample(
+            cond=audio,
+            text=[text],
+            duration=duration,
+            steps=steps,
+            ode_method=ode_method,
+            cfg_strength=args.cfg_strength,
+            sway_sampling_coef=args.sway_sampling_coef,
+            block_cache_threshold=block_cache_threshold,
+            block_cache_stats=block_cache_stats,
+            seed=args.seed,
+        )
+    if device == "cuda":
+        torch.cuda.synchronize()
+    return mel[:, ref_audio_len:, :].float(), time.perf_counter() - start
+
+
+run("euler", 2)  # warm-up
+reference, ref_time = run("euler", args.ref_steps)
+print(f"reference: euler, {args.ref_steps} steps, {ref_time:.3f} s")
+print(f"{'solver':<16}{'nfe':>5}{'steps':>7}{'time (s)':>10}{'mel l1':>10}{'mel l2':>10}{'skipped':>9}")
+for solver in args.solvers:
+    nfe_per_step = ODE_SOLVERS[solver].nfe_per_step
+    for nfe in args.nfe:
+        steps = max(1, nfe // nfe_per_step)
+        stats = dict(evaluated=0, skipped=0)
+        mel, wall_time = run(solver, steps, args.block_cache_threshold, stats)
+        l1 = (mel - reference).abs().mean().item()
+        l2 = (mel - reference).pow(2).mean().sqrt().item()
+        skipped = stats["skipped"] / max(1, stats["evaluated"] + stats["skipped"])  # ratio of block evaluations
+        print(f"{solver:<16}{steps * nfe_per_step:>5}{steps:>7}{wall_time:>10.3f}{l1:>10.4f}{l2:>10.4f}{skipped:>9.1%}")
@@ -0,0 +1,113 @@
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+import argparse
+import multiprocessing as mp
+import time
+from importlib.resources import files
+
+import torchaudio
+from cached_path import cached_path
+from omegaconf import OmegaConf
+
+from f5_tts.infer.utils_infer import infer_batch_process, load_model, load_vocoder, preprocess_ref_audio_text
+from f5_tts.infer.utils_runtime import get_available_cores, parse_core_list, setup_worker_threads
+from f5_tts.model import DiT, UNetT  # noqa: F401. used for config
+
+
+""" cpu sweep of workers x intra-op threads on a fixed core count: aggregate throughput and per request latency,
+each worker a separate process running its own model, as when serving several socket servers on one host """
+
+parser = argparse.ArgumentParser(description="Find the best workers x threads split for the given cores.")
+parser.add_argument("--model", type=str, default="F5TTS_v1_Base")
+parser.add_argument("--ckpt_file", type=str, default="")
+parser.add_argument("--vocab_file", type=str, default="")
+parser.add_argument(
+    "--ref_audio", type=str, default=str(files("f5_tts").joinpath("infer/examples/basic/basic_ref_en.wav"))
+)
+parser.add_argument("--ref_text", type=str, default="Some call me nature, others call me mother nature.")
+parser.add_argument(
+    "--gen_text", type=str, default="I've been a silent spectator, watching species evolve, empires rise and fall."
+)
+parser.add_argument("--nfe_step", type=int, default=16)
+parser.add_argument("--requests", type=int, default=4, help="Requests per worker, after one warm-up")
+parser.add_argument("--cores", type=str, default=None, help="Cores to use, e.g. 0-15, default all available")
+parser.add_argument("--workers", type=int, nargs="+", default=None, help="Worker counts to try, default powers of 2")
+parser.add_argument("--inter_op_threads", type=int, default=1)
+parser.add_argument("--pin_cores", action="store_true", help="Pin each worker to its core slice")
+parser.add_argument("--dtype", type=str, default=None, choices=["float32", "bfloat16"])
+args = parser.parse_args()
+
+model_cfg = OmegaConf.load(str(files("f5_tts").joinpath(f"configs/{args.model}.yaml"))).model
+mel_spec_type = model_cfg.mel_spec.mel_spec_type
+
+
+def worker(rank, num_workers, cores, ckpt_file, ref_audio, ref_text, barrier, results):
+    setup_worker_threads(num_workers, rank, cores, args.inter_op_threads, pin_cores=args.pin_cores)
+    model = load_model(
+        globals()[model_cfg.backbone],
+        model_cfg.arch,
+        ckpt_file,
+        mel_spec_type,
+        args.vocab_file,
+        device="cpu",
+        dtype=args.dtype,
+    )
+    vocoder = load_vocoder(vocoder_name=mel_spec_type, device="cpu")
+    audio = torchaudio.load(ref_audio)
+
+    def generate():
+        wave, sr, _ = next(
+            infer_batch_process(
+                audio, ref_text, [args.gen_text], model, vocoder, mel_spec_type, progress=None, nfe_step=args.nfe_step
+            )
+        )
+        return len(wave) / sr
+
+    generate()  # warm-up
+    barrier.wait()  # all workers loaded, measure them running concurrently
+    audio_time, latencies = 0.0, []
+    for _ in range(args.requests):
+        start = time.perf_counter()
+        audio_time += generate()
+        latencies.append(time.perf_counter() - start)
+    results.put((audio_time, latencies))
+
+
+if __name__ == "__main__":
+    cores = parse_core_list(args.cores) if args.cores else get_available_cores()
+    worker_counts = args.workers or [2**i for i in range(len(cores).bit_length()) if 2**i <= len(cores)]
+    ckpt_file = args.ckpt_file or str(cached_path(f"hf://SWivid/F5-TTS/{args.model}/model_1250000.safetensors"))
+    ref_audio, ref_text = preprocess_ref_audio_text(args.ref_audio, args.ref_text)
+
+    ctx = mp.get_context("spawn")  # fresh torch thread pools in each worker
+    rows = []
+    for num_workers in worker_counts:
+        barrier, results = ctx.Barrier(num_workers + 1), ctx.Queue()
+        procs = [
+            ctx.Process(
+                target=worker, args=(rank, num_workers, cores, ckpt_file, ref_audio, ref_text, barrier, results)
+            )
+            for rank in range(num_workers)
+        ]
+        for p in procs:
+            p.start()
+        barrier.wait()
+        start = time.perf_counter()
+        outputs = [results.get() for _ in procs]
+        wall_time = time.perf_counter() - start
+        for p in procs:
+            p.join()
+
+        audio_time = sum(output[0] for output in outputs)
+        latencies = sorted(latency for output in outputs for latency in output[1])
+        rows.append((num_workers, len(cores) // num_workers, audio_time / wall_time, latencies[len(latencies) // 2]))
+
+    print(f"\n{len(cores)} cores, {args.inter_op_threads} inter-op thread(s), pin_cores={args.pin_cores}")
+    print(f"{'workers':>8}{'threads':>9}{'audio s / s':>13}{'p50 latency s':>15}")
+    for num_workers, threads, throughput, p50 in rows:
+        print(f"{num_workers:>8}{threads:>9}{throughput:>13.2f}{p50:>15.2f}")
+    best = max(rows, key=lambda row: row[2])
+    print(f"best throughput: {best[0]} workers x {best[1]} threads")
@@ -0,0 +1,90 @@
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+import argparse
+import random
+import statistics
+import time
+from importlib.resources import files
+
+import torch
+from omegaconf import OmegaConf
+from torch.profiler import ProfilerActivity, profile
+
+from f5_tts.model import CFM, DiT, UNetT  # noqa: F401. used for config
+from f5_tts.model.modules import SampleWorkspace
+
+
+""" allocation churn of replayed sample calls, with and without a reused SampleWorkspace:
+allocator calls per request, latency jitter and rss growth. randomly initialized weights, only shapes matter """
+
+parser = argparse.ArgumentParser(description="Count allocations of repeated sampling with and without a workspace.")
+parser.add_argument("--model", type=str, default="F5TTS_v1_Base")
+parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+parser.add_argument("--requests", type=int, default=20)
+parser.add_argument("--batch_size", type=int, default=1)
+parser.add_argument("--min_frames", type=int, default=600)
+parser.add_argument("--max_frames", type=int, default=900)
+parser.add_argument("--frame_bucket", type=int, default=128, help="Round lengths up, so similar requests share buffers")
+parser.add_argument("--nfe_step", type=int, default=8)
+parser.add_argument("--seed", type=int, default=0)
+args = parser.parse_args()
+
+model_cfg = OmegaConf.load(str(files("f5_tts").joinpath(f"configs/{args.model}.yaml"))).model
+mel_dim, text_len = model_cfg.mel_spec.n_mel_channels, 64
+transformer = globals()[model_cfg.backbone](**model_cfg.arch, text_num_embeds=256, mel_dim=mel_dim)
+model = CFM(transformer=transformer, mel_spec_kwargs=dict(model_cfg.mel_spec)).to(args.device).eval()
+model.frame_bucket = args.frame_bucket  # bucketing without compile, extra frames are masked out
+
+random.seed(args.seed)
+requests = [
+    (random.randint(args.min_frames // 3, args.min_frames // 2), random.randint(args.min_frames, args.max_frames))
+    for _ in range(args.requests)
+]
+
+
+def rss_mib():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def run(workspace):
+    latencies = []
+    for ref_len, duration in requests:
+        cond = torch.randn(args.batch_size, ref_len, mel_dim, device=args.device)
+        text = torch.randint(0, 256, (args.batch_size, text_len), device=args.device)
+        start = time.perf_counter()
+        with torch.inference_mode():
+            model.sample(
+                cond, text, duration, steps=args.nfe_step, cfg_strength=2.0, seed=args.seed, workspace=workspace
+            )
+        if args.device.startswith("cuda"):
+            torch.cuda.synchronize()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def count_allocations(workspace):
+    if args.device.startswith("cuda"):
+        before = torch.cuda.memory_stats()["allocation.all.allocated"]
+        run(workspace)
+        return torch.cuda.memory_stats()["allocation.all.allocated"] - before
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        run(workspace)
+    return sum(1 for event in prof.events() if event.name == "[memory]" and event.cpu_memory_usage > 0)
+
+
+print(f"{'':<10}{'allocs/req':>12}{'latency ms':>12}{'stdev ms':>10}{'rss +MiB':>10}{'ws allocs':>11}{'ws reuses':>11}")
+for name, workspace in [("baseline", None), ("workspace", SampleWorkspace())]:
+    run(workspace)  # warm-up, fills the workspace for the replayed shapes
+    rss = rss_mib()
+    latencies = [latency * 1000 for latency in run(workspace)]
+    rss_growth = rss_mib() - rss
+    allocs = count_allocations(workspace) / args.requests
+    ws_allocs, ws_reuses = (workspace.allocations, workspace.reuses) if workspace is not None else (0, 0)
+    print(
+        f"{name:<10}{allocs:>12.1f}{statistics.mean(latencies):>12.1f}{statistics.stdev(latencies):>10.2f}"
+        f"{rss_growth:>10.1f}{ws_allocs:>11}{ws_reuses:>11}"
+    )
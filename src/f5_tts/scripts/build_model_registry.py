@@ -0,0 +1,73 @@
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+import argparse
+import json
+
+from huggingface_hub import hf_hub_download, snapshot_download
+
+from f5_tts.infer.utils_infer import get_model_registry_path, load_model_registry, sha256sum
+
+
+""" fetch model files once (with network) and write the local registry manifest, or verify an existing one """
+
+DEFAULT_URIS = [
+    "hf://SWivid/F5-TTS/F5TTS_v1_Base/model_1250000.safetensors",
+    "hf://SWivid/F5-TTS/F5TTS_v1_Base/vocab.txt",
+    "hf://charactr/vocos-mel-24khz/config.yaml",
+    "hf://charactr/vocos-mel-24khz/pytorch_model.bin",
+    "hf://openai/whisper-large-v3-turbo",  # asr, transcribes the reference when no ref_text is given
+]
+
+parser = argparse.ArgumentParser(description="Build or verify the local model registry manifest.")
+parser.add_argument("--uris", type=str, nargs="+", default=DEFAULT_URIS, help="hf://repo/file, or hf://repo for all")
+parser.add_argument("--registry", type=str, default=None, help="Manifest path, default $F5TTS_MODEL_REGISTRY")
+parser.add_argument("--cache_dir", type=str, default=None, help="Where to download to, default hf cache")
+parser.add_argument("--verify", action="store_true", help="Check size and sha256 of an existing manifest, no fetch")
+args = parser.parse_args()
+
+registry_path = args.registry or get_model_registry_path()
+
+
+if args.verify:
+    ok = True
+    for uri, entry in load_model_registry(registry_path).items():
+        path = entry["path"]
+        if not os.path.exists(path):
+            status = "missing"
+        elif os.path.isdir(path):
+            status = "ok (directory)"
+        elif "size" in entry and os.path.getsize(path) != entry["size"]:
+            status = "size mismatch"
+        elif "sha256" in entry and sha256sum(path) != entry["sha256"]:
+            status = "sha256 mismatch"
+        else:
+            status = "ok"
+        ok = ok and status.startswith("ok")
+        print(f"{status:<16}{uri} -> {path}")
+    sys.exit(0 if ok else 1)
+
+registry = {}
+if os.path.isfile(registry_path):
+    with open(registry_path, "r", encoding="utf-8") as f:
+        registry = json.load(f)
+
+for uri in args.uris:
+    repo_type, _, repo_path = uri.partition("://")
+    assert repo_type == "hf", f"Only hf:// uris are supported, got {uri}"
+    parts = repo_path.split("/")
+    repo_id, filename = "/".join(parts[:2]), "/".join(parts[2:])
+    if filename:
+        path = hf_hub_download(repo_id=repo_id, filename=filename, cache_dir=args.cache_dir)
+        registry[uri] = dict(path=os.path.abspath(path), size=os.path.getsize(path), sha256=sha256sum(path))
+    else:  # whole repo, e.g. bigvgan
+        path = snapshot_download(repo_id=repo_id, cache_dir=args.cache_dir)
+        registry[uri] = dict(path=os.path.abspath(path))
+    print(f"{uri} -> {path}")
+
+os.makedirs(os.path.dirname(os.path.abspath(registry_path)), exist_ok=True)
+with open(registry_path, "w", encoding="utf-8") as f:
+    json.dump(registry, f, indent=4)
+print(f"Registry written to {registry_path}")
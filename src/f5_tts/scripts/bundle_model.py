@@ -0,0 +1,74 @@
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+import argparse
+import time
+from importlib.resources import files
+
+import torch
+from cached_path import cached_path
+from huggingface_hub import hf_hub_download
+from omegaconf import OmegaConf
+
+from f5_tts.infer.utils_infer import load_bundle, load_model, load_vocoder, save_bundle
+from f5_tts.model import DiT, UNetT  # noqa: F401. used for config
+
+
+""" pack model & vocos weights, vocab and configs into one inference-only safetensors bundle, see load_bundle() """
+
+parser = argparse.ArgumentParser(description="Write a memory-mappable deployment bundle.")
+parser.add_argument("--model", type=str, default="F5TTS_v1_Base")
+parser.add_argument("--ckpt_file", type=str, default="")
+parser.add_argument("--vocab_file", type=str, default="")
+parser.add_argument("--vocoder_local_path", type=str, default=None, help="Local vocos dir, with config.yaml")
+parser.add_argument(
+    "--dtype",
+    type=str,
+    default="float32",
+    choices=["float32", "float16", "bfloat16"],
+    help="Model weights dtype. Half precision halves a gpu bundle, on cpu it is cast back to float32 when loaded",
+)
+parser.add_argument("--no_ema", action="store_true", help="Use the raw model weights instead of EMA")
+parser.add_argument("--output", type=str, default="ckpts/F5TTS_v1_Base.bundle.safetensors")
+args = parser.parse_args()
+
+model_cfg = OmegaConf.load(str(files("f5_tts").joinpath(f"configs/{args.model}.yaml"))).model
+if model_cfg.mel_spec.mel_spec_type != "vocos":
+    raise ValueError("Bundle only supports vocos vocoder")
+ckpt_file = args.ckpt_file or str(cached_path(f"hf://SWivid/F5-TTS/{args.model}/model_1250000.safetensors"))
+vocab_file = args.vocab_file or str(files("f5_tts").joinpath("infer/examples/vocab.txt"))
+if args.vocoder_local_path is not None:
+    vocoder_config_path = f"{args.vocoder_local_path}/config.yaml"
+else:
+    vocoder_config_path = hf_hub_download(repo_id="charactr/vocos-mel-24khz", filename="config.yaml")
+
+model = load_model(
+    globals()[model_cfg.backbone],
+    model_cfg.arch,
+    ckpt_file,
+    vocab_file=vocab_file,
+    use_ema=not args.no_ema,
+    device="cpu",
+)
+vocoder = load_vocoder(
+    "vocos", is_local=args.vocoder_local_path is not None, local_path=args.vocoder_local_path, device="cpu"
+)
+
+os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+save_bundle(
+    args.output,
+    model,
+    vocoder,
+    model_cfg.backbone,
+    OmegaConf.to_container(model_cfg.arch),
+    vocab_file,
+    vocoder_config_path,
+    dtype=getattr(torch, args.dtype),
+)
+print(f"Bundle written to {args.output} ({os.path.getsize(args.output) / 2**20:.1f} MiB)")
+
+start = time.perf_counter()
+load_bundle(args.output, device="cpu")
+print(f"Bundle loads in {time.perf_counter() - start:.2f} s")
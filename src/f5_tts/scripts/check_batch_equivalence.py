@@ -0,0 +1,125 @@
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+import argparse
+import random
+import string
+from concurrent.futures import Future
+from importlib.resources import files
+
+import torch
+from omegaconf import OmegaConf
+
+from f5_tts.infer.utils_batch import BatchRequest, BatchScheduler, ContinuousBatchScheduler
+from f5_tts.infer.utils_infer import decode_mels, load_vocoder, target_rms
+from f5_tts.model import CFM, DiT, UNetT  # noqa: F401. used for config
+
+
+""" regression check, an item's output must not depend on what it is batched with: a padded batch and the serving
+schedulers must match sampling and vocoding each item alone within tolerance. randomly initialized model weights
+(output layers included, which are zero at init), only masking matters. the real vocoder, as its receptive field
+reaches into padding too. exits non-zero on a mismatch """
+
+parser = argparse.ArgumentParser(description="Check that batched sampling matches per-item sampling.")
+parser.add_argument("--model", type=str, default="F5TTS_v1_Base")
+parser.add_argument("--device", type=str, default="cpu")
+parser.add_argument("--nfe_step", type=int, default=4)
+parser.add_argument("--tolerance", type=float, default=5e-3, help="Max abs mel difference")
+parser.add_argument("--wave_tolerance", type=float, default=1e-2, help="Max abs wave difference over the peak")
+parser.add_argument("--seed", type=int, default=0)
+args = parser.parse_args()
+
+model_cfg = OmegaConf.load(str(files("f5_tts").joinpath(f"configs/{args.model}.yaml"))).model
+mel_dim, mel_spec_type = model_cfg.mel_spec.n_mel_channels, model_cfg.mel_spec.mel_spec_type
+transformer = globals()[model_cfg.backbone](**model_cfg.arch, text_num_embeds=256, mel_dim=mel_dim)
+model = CFM(transformer=transformer, mel_spec_kwargs=dict(model_cfg.mel_spec)).to(args.device).eval()
+torch.manual_seed(args.seed)
+with torch.no_grad():
+    for param in model.parameters():
+        param.normal_(std=0.02)
+
+guidance = dict(cfg_strength=2.0, sway_sampling_coef=-1, seed=args.seed)
+
+# (ref frames, text chars, total frames), mixed lengths so all but the longest are padded.
+# no vocab map, so text is utf-8 bytes as tokens
+items = [(96, 40, 320), (48, 16, 150), (64, 24, 230)]
+random.seed(args.seed)
+refs = [torch.randn(ref_len, mel_dim, device=args.device) for ref_len, _, _ in items]
+texts = ["".join(random.choices(string.ascii_lowercase + " ", k=text_len)) for _, text_len, _ in items]
+durations = [duration for _, _, duration in items]
+
+
+def sample(i):
+    out, _ = model.sample(refs[i][None], [texts[i]], durations[i], steps=args.nfe_step, **guidance)
+    return out[0, len(refs[i]) : durations[i]]
+
+
+def sample_batched():
+    out, _ = model.sample(
+        torch.nn.utils.rnn.pad_sequence(refs, batch_first=True),
+        texts,
+        torch.tensor(durations, device=args.device),
+        lens=torch.tensor([len(ref) for ref in refs], device=args.device),
+        steps=args.nfe_step,
+        **guidance,
+    )
+    return [out[i, len(ref) : duration] for i, (ref, duration) in enumerate(zip(refs, durations))]
+
+
+def run_scheduler(scheduler, groups):
+    # groups of items submitted together, each group finished before the next is submitted
+    outputs = [None] * len(items)
+    scheduler.start()
+    try:
+        for group in groups:
+            futures = {}
+            for i in group:
+                futures[i] = Future()
+                scheduler.submit(
+                    BatchRequest(
+                        refs[i], len(refs[i]), target_rms, texts[i], durations[i], key=i, callback=futures[i].set_result
+                    )
+                )
+            for i, future in futures.items():
+                wave = future.result()
+                if isinstance(wave, Exception):
+                    raise wave
+                outputs[i] = wave
+    finally:
+        scheduler.stop()
+    return outputs
+
+
+def check(name, outputs, references, tolerance):
+    # mels as torch tensors, absolute. waves as numpy, relative to the reference peak
+    if isinstance(references[0], torch.Tensor):
+        diffs = [(out - ref).abs().max().item() for out, ref in zip(outputs, references)]
+    else:
+        diffs = [abs(out - ref).max() / max(abs(ref).max(), 1e-8) for out, ref in zip(outputs, references)]
+    ok = max(diffs) <= tolerance
+    print(f"{name:<28}" + "".join(f"{diff:>10.2e}" for diff in diffs) + f"{'ok' if ok else 'MISMATCH':>10}")
+    return ok
+
+
+if __name__ == "__main__":
+    results = []
+    with torch.inference_mode():
+        alone = [sample(i) for i in range(len(items))]
+        print(f"{'max abs diff per item':<28}" + "".join(f"{f'{duration} fr':>10}" for duration in durations))
+        results.append(check("padded batch", sample_batched(), alone, args.tolerance))
+
+    vocoder = load_vocoder(vocoder_name=mel_spec_type, device=args.device)
+    waves = [decode_mels(vocoder, [mel], mel_spec_type)[0][0] for mel in alone]
+    batched_waves = [wave for wave, _ in decode_mels(vocoder, alone, mel_spec_type)]
+    results.append(check("vocoder, together", batched_waves, waves, args.wave_tolerance))
+    one_by_one, all_at_once = [[i] for i in range(len(items))], [list(range(len(items)))]
+    for name, groups in [("one by one", one_by_one), ("all at once", all_at_once)]:
+        scheduler = BatchScheduler(model, vocoder, batch_window=0.5, nfe_step=args.nfe_step, **guidance)
+        results.append(check(f"batch scheduler, {name}", run_scheduler(scheduler, groups), waves, args.wave_tolerance))
+    if hasattr(model.transformer, "forward_from_embed"):  # continuous batching is DiT only
+        for name, groups in [("one by one", one_by_one), ("all at once", all_at_once)]:
+            scheduler = ContinuousBatchScheduler(model, vocoder, nfe_step=args.nfe_step, **guidance)
+            results.append(check(f"continuous, {name}", run_scheduler(scheduler, groups), waves, args.wave_tolerance))
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,73 @@
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+import argparse
+import random
+from importlib.resources import files
+
+import torch
+from omegaconf import OmegaConf
+from torch._dynamo.testing import CompileCounter
+
+from f5_tts.model import CFM, DiT, UNetT  # noqa: F401. used for config
+
+
+""" regression check, after warm_up() compiled sampling must not recompile for new text or audio lengths or batch
+sizes (mixed lengths within a batch, as packed by infer_batch_process and the batch scheduler), the frame and batch
+buckets bound the number of graphs. counts dynamo compilations with a counting backend (no inductor,
+so it runs in seconds), randomly initialized weights. exits non-zero on a recompile """
+
+parser = argparse.ArgumentParser(description="Check that compiled sampling is bounded by the frame and batch buckets.")
+parser.add_argument("--model", type=str, default="F5TTS_v1_Base")
+parser.add_argument("--device", type=str, default="cpu")
+parser.add_argument("--frame_bucket", type=int, default=128)
+parser.add_argument("--max_duration", type=int, default=384)
+parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 2, 4], help="Compiled batch sizes")
+parser.add_argument("--requests", type=int, default=8)
+parser.add_argument("--seed", type=int, default=0)
+args = parser.parse_args()
+
+model_cfg = OmegaConf.load(str(files("f5_tts").joinpath(f"configs/{args.model}.yaml"))).model
+mel_dim, vocab_size = model_cfg.mel_spec.n_mel_channels, 256
+transformer = globals()[model_cfg.backbone](**model_cfg.arch, text_num_embeds=vocab_size, mel_dim=mel_dim)
+model = CFM(transformer=transformer, mel_spec_kwargs=dict(model_cfg.mel_spec)).to(args.device).eval()
+
+counter = CompileCounter()
+model.compile_transformer(
+    frame_bucket=args.frame_bucket, max_duration=args.max_duration, batch_sizes=args.batch_sizes, backend=counter
+)
+# past the cache size limit dynamo falls back to eager without compiling, which would look like no recompile. raise
+for name in ["fail_on_cache_limit_hit", "fail_on_recompile_limit_hit"]:  # renamed across torch versions
+    if hasattr(torch._dynamo.config, name):
+        setattr(torch._dynamo.config, name, True)
+
+if __name__ == "__main__":
+    random.seed(args.seed)
+    with torch.inference_mode():
+        model.warm_up(max_duration=args.max_duration)
+        warm_up_graphs = counter.frame_count
+
+        for _ in range(args.requests):
+            batch_size = random.randint(1, max(args.batch_sizes))  # sizes in between are rounded up
+            ref_lens = [random.randint(16, args.max_duration // 3) for _ in range(batch_size)]
+            text_lens = [random.randint(1, args.max_duration // 2) for _ in range(batch_size)]
+            durations = [random.randint(r + t + 1, args.max_duration) for r, t in zip(ref_lens, text_lens)]
+            cond = torch.randn(batch_size, max(ref_lens), mel_dim, device=args.device)
+            text = torch.full((batch_size, max(text_lens)), -1, dtype=torch.long, device=args.device)
+            for i, text_len in enumerate(text_lens):
+                text[i, :text_len] = torch.randint(0, vocab_size, (text_len,))
+            model.sample(
+                cond,
+                text,
+                torch.tensor(durations, device=args.device),
+                lens=torch.tensor(ref_lens, device=args.device),
+                steps=2,
+                cfg_strength=2.0,
+                max_duration=args.max_duration,
+            )
+
+    recompiles = counter.frame_count - warm_up_graphs
+    print(f"graphs after warm-up: {warm_up_graphs}, recompiles over {args.requests} requests: {recompiles}")
+    sys.exit(0 if recompiles == 0 else 1)
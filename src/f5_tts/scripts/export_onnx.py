@@ -0,0 +1,89 @@
+import sys
+import os
+
+sys.path.append(os.getcwd())
+
+import argparse
+from importlib.resources import files
+
+import torch
+import torchaudio
+from cached_path import cached_path
+from omegaconf import OmegaConf
+
+from f5_tts.infer.utils_infer import (
+    hop_length,
+    load_model,
+    load_vocoder,
+    prepare_ref_audio,
+    prepare_text_duration,
+    preprocess_ref_audio_text,
+    target_rms,
+)
+from f5_tts.infer.utils_onnx import OnnxVocos, export_onnx
+from f5_tts.model import DiT  # noqa: F401. used for config
+
+
+""" export the dit sampling graph and vocos decoder to onnx, then check parity of onnxruntime against pytorch """
+
+parser = argparse.ArgumentParser(description="Export DiT & Vocos to ONNX and check onnxruntime parity.")
+parser.add_argument("--model", type=str, default="F5TTS_v1_Base")
+parser.add_argument("--ckpt_file", type=str, default="")
+parser.add_argument("--vocab_file", type=str, default="")
+parser.add_argument("--output_dir", type=str, default="ckpts/onnx")
+parser.add_argument("--opset_version", type=int, default=17)
+parser.add_argument("--skip_check", action="store_true", help="Skip the parity check after export")
+parser.add_argument(
+    "--ref_audio", type=str, default=str(files("f5_tts").joinpath("infer/examples/basic/basic_ref_en.wav"))
+)
+parser.add_argument("--ref_text", type=str, default="Some call me nature, others call me mother nature.")
+parser.add_argument("--gen_text", type=str, default="I don't really care what you call me.")
+parser.add_argument("--nfe_step", type=int, default=16)
+parser.add_argument("--seed", type=int, default=0)
+args = parser.parse_args()
+
+device = "cpu"
+
+model_cfg = OmegaConf.load(str(files("f5_tts").joinpath(f"configs/{args.model}.yaml"))).model
+model_cls = globals()[model_cfg.backbone]
+ckpt_file = args.ckpt_file or str(cached_path(f"hf://SWivid/F5-TTS/{args.model}/model_1250000.safetensors"))
+mel_spec_type = model_cfg.mel_spec.mel_spec_type
+
+model = load_model(model_cls, model_cfg.arch, ckpt_file, mel_spec_type, args.vocab_file, device=device)
+vocoder = load_vocoder(vocoder_name=mel_spec_type, device=device)
+export_onnx(model, vocoder, args.output_dir, opset_version=args.opset_version)
+print(f"Exported to {args.output_dir}")
+
+if args.skip_check:
+    sys.exit()
+
+# parity, same seed and prompt through both backends
+
+onnx_model = load_model(
+    model_cls, model_cfg.arch, args.output_dir, mel_spec_type, args.vocab_file, device=device, backend="onnxruntime"
+)
+onnx_vocoder = OnnxVocos(args.output_dir, device=device)
+
+ref_audio, ref_text = preprocess_ref_audio_text(args.ref_audio, args.ref_text)
+audio, _ = prepare_ref_audio(*torchaudio.load(ref_audio), target_rms=target_rms, device=device)
+ref_audio_len = audio.shape[-1] // hop_length
+text, duration = prepare_text_duration(ref_text, args.gen_text, ref_audio_len)
+
+results = []
+for cfm, voc in [(model, vocoder), (onnx_model, onnx_vocoder)]:
+    with torch.inference_mode():
+        mel, _ = cfm.sample(
+            cond=audio,
+            text=[text],
+            duration=duration,
+            steps=args.nfe_step,
+            cfg_strength=2.0,
+            sway_sampling_coef=-1,
+            seed=args.seed,
+        )
+        mel = mel[:, ref_audio_len:, :].float()
+        results.append((mel, voc.decode(mel.permute(0, 2, 1))))
+
+(mel, wave), (onnx_mel, onnx_wave) = results
+for name, ref, out in [("mel", mel, onnx_mel), ("wave", wave, onnx_wave)]:
+    print(f"{name:<5} max abs diff {(ref - out).abs().max().item():.2e}, mean {(ref - out).abs().mean().item():.2e}")
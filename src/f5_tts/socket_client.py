@@ -1,17 +1,17 @@
-import socket
 import asyncio
 import pyaudio
-import numpy as np
 import logging
 import time
 
+from f5_tts.socket_protocol import FRAME_AUDIO, FRAME_ERROR, decode_audio, encode_request, encode_text, read_frame
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-async def listen_to_F5TTS(text, server_ip="localhost", server_port=9998):
-    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    await asyncio.get_event_loop().run_in_executor(None, client_socket.connect, (server_ip, int(server_port)))
+async def listen_to_F5TTS(text, server_ip="localhost", server_port=9998, voice=None, sample_format="float32"):
+    # text is a str, or an async iterable of fragments (e.g. streamed llm tokens), synthesized while still arriving
+    reader, writer = await asyncio.open_connection(server_ip, int(server_port))
 
     start_time = time.time()
     first_chunk_time = None
@@ -19,43 +19,83 @@ async def listen_to_F5TTS(text, server_ip="localhost", server_port=9998):
     async def play_audio_stream():
         nonlocal first_chunk_time
         p = pyaudio.PyAudio()
-        stream = p.open(format=pyaudio.paFloat32, channels=1, rate=24000, output=True, frames_per_buffer=2048)
+        stream = None
 
         try:
             while True:
-                data = await asyncio.get_event_loop().run_in_executor(None, client_socket.recv, 8192)
-                if not data:
+                try:
+                    frame_type, payload = await read_frame(reader)
+                except asyncio.IncompleteReadError:
+                    logger.error("Connection closed before the end of audio.")
                     break
-                if data == b"END":
-                    logger.info("End of audio received.")
+                if frame_type == FRAME_ERROR:
+                    logger.error(f"Server error: {payload.decode('utf-8')}")
+                    break
+                if frame_type != FRAME_AUDIO:
+                    continue
+
+                samples, sample_rate, seq, end = decode_audio(payload)
+                if stream is None:
+                    stream = p.open(
+                        format=pyaudio.paFloat32 if samples.dtype.kind == "f" else pyaudio.paInt16,
+                        channels=1,
+                        rate=sample_rate,
+                        output=True,
+                        frames_per_buffer=2048,
+                    )
+                if len(samples):
+                    await asyncio.to_thread(stream.write, samples.tobytes())
+                    if first_chunk_time is None:
+                        first_chunk_time = time.time()
+                        logger.info(f"Time to first chunk: {first_chunk_time - start_time:.4f} seconds")
+                if end:
+                    logger.info(f"End of audio received after {seq} chunks.")
                     break
-
-                audio_array = np.frombuffer(data, dtype=np.float32)
-                stream.write(audio_array.tobytes())
-
-                if first_chunk_time is None:
-                    first_chunk_time = time.time()
 
         finally:
-            stream.stop_stream()
-            stream.close()
+            if stream is not None:
+                stream.stop_stream()
+                stream.close()
             p.terminate()
 
         logger.info(f"Total time taken: {time.time() - start_time:.4f} seconds")
 
+    async def send_text_stream():
+        async for fragment in text:
+            writer.write(encode_text(fragment))
+            await writer.drain()
+        writer.write(encode_text("", end=True))
+        await writer.drain()
+
     try:
-        data_to_send = f"{text}".encode("utf-8")
-        await asyncio.get_event_loop().run_in_executor(None, client_socket.sendall, data_to_send)
-        await play_audio_stream()
+        if isinstance(text, str):
+            writer.write(encode_request(text, voice=voice, sample_format=sample_format))
+            await writer.drain()
+            await play_audio_stream()
+        else:
+            writer.write(encode_request("", voice=voice, sample_format=sample_format, stream=True))
+            sending = asyncio.create_task(send_text_stream())
+            try:
+                await play_audio_stream()
+            finally:
+                sending.cancel()
 
     except Exception as e:
         logger.error(f"Error in listen_to_F5TTS: {e}")
 
     finally:
-        client_socket.close()
+        writer.close()
+        await writer.wait_closed()
 
 
 if __name__ == "__main__":
     text_to_send = "As a Reader assistant, I'm familiar with new technology. which are key to its improved performance in terms of both training speed and inference efficiency. Let's break down the components"
 
+    async def stream_words(text, delay=0.05):
+        # stand-in for an llm streaming its reply
+        for word in text.split(" "):
+            yield word + " "
+            await asyncio.sleep(delay)
+
     asyncio.run(listen_to_F5TTS(text_to_send))
+    asyncio.run(listen_to_F5TTS(stream_words(text_to_send)))
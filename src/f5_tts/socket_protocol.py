@@ -0,0 +1,91 @@
+# framed binary protocol between socket_server and socket_client
+#
+# every frame: magic (3s) | version (B) | frame type (B) | payload length (I), network byte order
+#   request: utf-8 json {"text": str, "voice": str | null, "params": {...}}
+#   audio:   sample format (B) | sample rate (I) | sequence number (I) | flags (B), then raw little-endian samples
+#   error:   utf-8 message
+#   text:    flags (B), then a utf-8 fragment. follows a request with params {"stream": true}, until the end flag
+# the magic starts with a nul byte, which text never does, so the server can still serve legacy clients
+# (raw utf-8 text in, float32 samples then b"END" out) on the same port
+
+import json
+import struct
+
+import numpy as np
+
+
+MAGIC = b"\x00F5"
+VERSION = 1
+
+FRAME_REQUEST = 1
+FRAME_AUDIO = 2
+FRAME_ERROR = 3
+FRAME_TEXT = 4
+
+FRAME_HEADER = struct.Struct("!3sBBI")
+AUDIO_HEADER = struct.Struct("!BIIB")
+AUDIO_END = 1  # flag, last audio frame of a request
+TEXT_HEADER = struct.Struct("!B")
+TEXT_END = 1  # flag, last text fragment of a streamed request
+
+SAMPLE_FORMATS = {"float32": (0, np.dtype("<f4")), "int16": (1, np.dtype("<i2"))}
+SAMPLE_FORMAT_IDS = {format_id: dtype for format_id, dtype in SAMPLE_FORMATS.values()}
+
+MAX_REQUEST_SIZE = 2**20
+
+
+def encode_frame_header(frame_type, payload_size):
+    return FRAME_HEADER.pack(MAGIC, VERSION, frame_type, payload_size)
+
+
+def encode_request(text, voice=None, **params):
+    payload = json.dumps(dict(text=text, voice=voice, params=params)).encode("utf-8")
+    return encode_frame_header(FRAME_REQUEST, len(payload)) + payload
+
+
+def decode_request(payload):
+    request = json.loads(payload.decode("utf-8"))
+    return request["text"], request.get("voice"), request.get("params") or {}
+
+
+def encode_audio(samples, sample_rate, seq, end=False, sample_format="float32"):
+    # header bytes and a memoryview of the samples, for transport.writelines() without joining them
+    format_id, dtype = SAMPLE_FORMATS[sample_format]
+    if dtype.kind == "i":  # float [-1, 1] -> pcm
+        samples = np.clip(samples, -1.0, 1.0) * np.iinfo(dtype).max
+    samples = np.ascontiguousarray(samples, dtype=dtype)
+    header = encode_frame_header(FRAME_AUDIO, AUDIO_HEADER.size + samples.nbytes)
+    header += AUDIO_HEADER.pack(format_id, sample_rate, seq, AUDIO_END if end else 0)
+    return [header, memoryview(samples).cast("B")]
+
+
+def decode_audio(payload):
+    # samples as a read-only view on the payload, in their sent format
+    format_id, sample_rate, seq, flags = AUDIO_HEADER.unpack_from(payload)
+    samples = np.frombuffer(payload, dtype=SAMPLE_FORMAT_IDS[format_id], offset=AUDIO_HEADER.size)
+    return samples, sample_rate, seq, bool(flags & AUDIO_END)
+
+
+def encode_text(fragment, end=False):
+    payload = TEXT_HEADER.pack(TEXT_END if end else 0) + fragment.encode("utf-8")
+    return encode_frame_header(FRAME_TEXT, len(payload)) + payload
+
+
+def decode_text(payload):
+    (flags,) = TEXT_HEADER.unpack_from(payload)
+    return payload[TEXT_HEADER.size :].decode("utf-8"), bool(flags & TEXT_END)
+
+
+def encode_error(message):
+    payload = message.encode("utf-8")
+    return encode_frame_header(FRAME_ERROR, len(payload)) + payload
+
+
+async def read_frame(reader, max_size=None):
+    # -> (frame type, payload), raises asyncio.IncompleteReadError at end of stream
+    magic, version, frame_type, size = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Unsupported frame, magic {magic!r} version {version}")
+    if max_size is not None and size > max_size:
+        raise ValueError(f"Frame of {size} bytes exceeds the limit of {max_size}")
+    return frame_type, await reader.readexactly(size)
@@ -1,10 +1,11 @@
 import argparse
+import asyncio
 import gc
 import logging
 import numpy as np
+import os
 import queue
 import socket
-import struct
 import threading
 import traceback
 import wave
@@ -12,16 +13,35 @@ from importlib.resources import files
 
 import torch
 import torchaudio
-from huggingface_hub import hf_hub_download
 from omegaconf import OmegaConf
 
 from f5_tts.model.backbones.dit import DiT  # noqa: F401. used for config
+from f5_tts.model.modules import SampleWorkspace
+from f5_tts.infer.utils_batch import BatchRequest, BatchScheduler, ContinuousBatchScheduler
 from f5_tts.infer.utils_infer import (
+    TextChunker,
     chunk_text,
+    hop_length,
     preprocess_ref_audio_text,
+    prepare_ref_audio,
+    prepare_text_duration,
     load_vocoder,
     load_model,
     infer_batch_process,
+    resolve_model_file,
+)
+from f5_tts.infer.utils_runtime import parse_core_list, setup_worker_threads
+from f5_tts.socket_protocol import (
+    FRAME_REQUEST,
+    FRAME_TEXT,
+    MAGIC,
+    MAX_REQUEST_SIZE,
+    SAMPLE_FORMATS,
+    decode_request,
+    decode_text,
+    encode_audio,
+    encode_error,
+    read_frame,
 )
 
 logging.basicConfig(level=logging.INFO)
@@ -69,7 +89,18 @@ class AudioFileWriterThread(threading.Thread):
 
 
 class TTSStreamingProcessor:
-    def __init__(self, model, ckpt_file, vocab_file, ref_audio, ref_text, device=None, dtype=torch.float32):
+    def __init__(
+        self,
+        model,
+        ckpt_file,
+        vocab_file,
+        ref_audio,
+        ref_text,
+        device=None,
+        dtype="float32",  # "float32" | "float16" | "bfloat16", see load_model()
+        compile=False,
+        compile_cache_dir=None,
+    ):
         self.device = device or (
             "cuda"
             if torch.cuda.is_available()
@@ -87,11 +118,12 @@ class TTSStreamingProcessor:
 
         self.model = self.load_ema_model(ckpt_file, vocab_file, dtype)
         self.vocoder = self.load_vocoder_model()
+        self.workspace = SampleWorkspace()  # model only runs on the scheduler thread, buffers reused across batches
 
         self.update_reference(ref_audio, ref_text)
+        if compile:
+            self.model.compile_transformer(cache_dir=compile_cache_dir)
         self._warm_up()
-        self.file_writer_thread = None
-        self.first_package = True
 
     def load_ema_model(self, ckpt_file, vocab_file, dtype):
         return load_model(
@@ -103,7 +135,8 @@ class TTSStreamingProcessor:
             ode_method="euler",
             use_ema=True,
             device=self.device,
-        ).to(self.device, dtype=dtype)
+            dtype=dtype,
+        )
 
     def load_vocoder_model(self):
         return load_vocoder(vocoder_name=self.mel_spec_type, is_local=False, local_path=None, device=self.device)
@@ -112,6 +145,13 @@ class TTSStreamingProcessor:
         self.ref_audio, self.ref_text = preprocess_ref_audio_text(ref_audio, ref_text)
         self.audio, self.sr = torchaudio.load(self.ref_audio)
 
+        # reference mel & loudness, shared by all requests of this voice
+        audio, rms = prepare_ref_audio(self.audio, self.sr, device=self.device)
+        with torch.inference_mode():
+            self.ref_mel = self.model.mel_spec(audio).permute(0, 2, 1)[0]  # 1 d n -> n d
+        self.ref_rms = rms.item()
+        self.ref_audio_len = audio.shape[-1] // hop_length
+
         ref_audio_duration = self.audio.shape[-1] / self.sr
         ref_text_byte_len = len(self.ref_text.encode("utf-8"))
         self.max_chars = int(ref_text_byte_len / (ref_audio_duration) * (25 - ref_audio_duration))
@@ -120,6 +160,9 @@ class TTSStreamingProcessor:
 
     def _warm_up(self):
         logger.info("Warming up the model...")
+        if self.model.frame_bucket is not None:
+            logger.info("Compiling all frame buckets...")
+            self.model.warm_up()
         gen_text = "Warm-up text for the model."
         for _ in infer_batch_process(
             (self.audio, self.sr),
@@ -130,84 +173,277 @@ class TTSStreamingProcessor:
             progress=None,
             device=self.device,
             streaming=True,
+            workspace=self.workspace,
         ):
             pass
         logger.info("Warm-up completed.")
 
-    def generate_stream(self, text, conn):
+    def prepare_requests(self, text, session, speed=1):
+        # text chunks of one request, for the batch scheduler. keyed by session, so they are generated in order
         text_batches = chunk_text(text, max_chars=self.max_chars)
-        if self.first_package:
+        if session.first_package:
             text_batches = chunk_text(text_batches[0], max_chars=self.few_chars) + text_batches[1:]
             text_batches = chunk_text(text_batches[0], max_chars=self.min_chars) + text_batches[1:]
-            self.first_package = False
+            session.first_package = False
+        return self.make_requests(text_batches, session, speed)
 
-        audio_stream = infer_batch_process(
-            (self.audio, self.sr),
-            self.ref_text,
-            text_batches,
-            self.model,
-            self.vocoder,
-            progress=None,
-            device=self.device,
-            streaming=True,
-            chunk_size=2048,
+    def text_chunker(self, session):
+        # for text streamed in fragments, the first chunk is released at min_chars as above, later ones at few_chars
+        chunker = TextChunker(
+            self.max_chars, self.few_chars, first_chars=self.min_chars if session.first_package else self.few_chars
         )
-
-        # Reset the file writer thread
-        if self.file_writer_thread is not None:
-            self.file_writer_thread.stop()
-        self.file_writer_thread = AudioFileWriterThread("output.wav", self.sampling_rate)
-        self.file_writer_thread.start()
-
-        for audio_chunk, _ in audio_stream:
-            if len(audio_chunk) > 0:
-                logger.info(f"Generated audio chunk of size: {len(audio_chunk)}")
-
-                # Send audio chunk via socket
-                conn.sendall(struct.pack(f"{len(audio_chunk)}f", *audio_chunk))
-
-                # Write to file asynchronously
-                self.file_writer_thread.add_chunk(audio_chunk)
-
-        logger.info("Finished sending audio stream.")
-        conn.sendall(b"END")  # Send end signal
-
-        # Ensure all audio data is written before exiting
-        self.file_writer_thread.stop()
-
-
-def handle_client(conn, processor):
-    try:
-        with conn:
-            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        session.first_package = False
+        return chunker
+
+    def make_requests(self, text_batches, session, speed=1):
+        # reference mel & rms are computed once per voice, every chunk reuses them
+        requests = []
+        for gen_text in text_batches:
+            final_text, duration = prepare_text_duration(self.ref_text, gen_text, self.ref_audio_len, speed)
+            requests.append(
+                BatchRequest(
+                    self.ref_mel, self.ref_audio_len, self.ref_rms, final_text, duration, key=session.session_id
+                )
+            )
+        return requests
+
+
+class TTSSession:
+    """Per-connection state, kept off the shared processor so concurrent clients don't interfere."""
+
+    def __init__(self, session_id, output_dir=None):
+        self.session_id = session_id
+        self.first_package = True  # first request of a connection is split finer, for a fast first audio
+        self.output_file = os.path.join(output_dir, f"session_{session_id}.wav") if output_dir else None
+
+
+class PrefixedReader:
+    """Stream reader that first returns bytes already read, e.g. while detecting the protocol."""
+
+    def __init__(self, prefix, reader):
+        self.prefix = prefix
+        self.reader = reader
+
+    async def readexactly(self, n):
+        data, self.prefix = self.prefix[:n], self.prefix[n:]
+        if len(data) < n:
+            data += await self.reader.readexactly(n - len(data))
+        return data
+
+
+def set_future(future, result):
+    # on the event loop, from the scheduler thread through call_soon_threadsafe
+    if future.done():  # the connection already gave up on it
+        return
+    if isinstance(result, Exception):
+        future.set_exception(result)
+    else:
+        future.set_result(result)
+
+
+class TTSServer:
+    """Asyncio server, one session per connection. Text chunks of all sessions go to one batch scheduler, which runs
+    them together as batched sample calls on its own thread, so the event loop keeps accepting and streaming."""
+
+    def __init__(
+        self,
+        processor,
+        max_queue_size=16,
+        output_dir=None,
+        scheduler="batch",  # "batch" | "continuous", admit requests between ode steps, DiT only
+        batch_window=0.02,
+        batch_frame_budget=16384,
+    ):
+        self.processor = processor
+        self.max_queue_size = max_queue_size
+        self.output_dir = output_dir
+        if scheduler == "batch":
+            self.scheduler = BatchScheduler(
+                processor.model,
+                processor.vocoder,
+                processor.mel_spec_type,
+                batch_window=batch_window,
+                batch_frame_budget=batch_frame_budget,
+                workspace=processor.workspace,
+            )
+        elif scheduler == "continuous":
+            self.scheduler = ContinuousBatchScheduler(
+                processor.model, processor.vocoder, processor.mel_spec_type, batch_frame_budget=batch_frame_budget
+            )
+        else:
+            raise ValueError(f"Unsupported scheduler: {scheduler}, choose from 'batch', 'continuous'")
+        self.slots = None  # pending requests, created in the running loop
+        self.num_sessions = 0
+
+    async def serve(self, host, port):
+        self.slots = asyncio.Semaphore(self.max_queue_size)
+        self.scheduler.start()
+        server = await asyncio.start_server(self.handle_client, host, port)
+        logger.info(f"Server started on {host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.scheduler.stop()
+
+    def submit(self, requests):
+        # chunks are batched with other sessions' chunks, but generated in order
+        loop = asyncio.get_running_loop()
+        futures = []
+        for request in requests:
+            future = loop.create_future()
+            request.callback = lambda result, future=future: loop.call_soon_threadsafe(set_future, future, result)
+            self.scheduler.submit(request)
+            futures.append(future)
+        return futures
+
+    async def send_audio(self, session, futures, send):
+        # awaits the futures from a queue, ended by None, and send(audio_chunk) for each chunk in order
+        file_writer_thread = None
+        if session.output_file is not None:
+            file_writer_thread = AudioFileWriterThread(session.output_file, self.processor.sampling_rate)
+            file_writer_thread.start()
+
+        try:
             while True:
-                data = conn.recv(1024)
-                if not data:
-                    processor.first_package = True
+                future = await futures.get()
+                if future is None:
                     break
-                data_str = data.decode("utf-8").strip()
-                logger.info(f"Received text: {data_str}")
+                audio_chunk = await future
+                logger.info(f"Session {session.session_id}: audio chunk of size {len(audio_chunk)}")
+                await send(audio_chunk)
 
-                try:
-                    processor.generate_stream(data_str, conn)
-                except Exception as inner_e:
-                    logger.error(f"Error during processing: {inner_e}")
-                    traceback.print_exc()
-                    break
-    except Exception as e:
-        logger.error(f"Error handling client: {e}")
-        traceback.print_exc()
-
-
-def start_server(host, port, processor):
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind((host, port))
-        s.listen()
-        logger.info(f"Server started on {host}:{port}")
+                # Write to file asynchronously
+                if file_writer_thread is not None:
+                    file_writer_thread.add_chunk(audio_chunk)
+        finally:
+            # Ensure all audio data is written
+            if file_writer_thread is not None:
+                await asyncio.to_thread(file_writer_thread.stop)
+        logger.info(f"Session {session.session_id}: finished sending audio stream.")
+
+    async def synthesize(self, session, text, send, speed=1):
+        logger.info(f"Session {session.session_id}: received text: {text}")
+        futures = asyncio.Queue()
+        try:
+            async with self.slots:  # waits while too many requests are pending
+                for future in self.submit(self.processor.prepare_requests(text, session, speed=speed)):
+                    futures.put_nowait(future)
+                futures.put_nowait(None)
+                await self.send_audio(session, futures, send)
+        finally:
+            self.scheduler.cancel(session.session_id)  # nothing left pending if the client went away
+
+    async def synthesize_stream(self, session, text, reader, send, speed=1):
+        # text arrives in fragments, each chunk is submitted as soon as the chunker releases it,
+        # while audio of the earlier chunks is already being sent
+        chunker = self.processor.text_chunker(session)
+        futures, submitted = asyncio.Queue(), []
+
+        async def read_text(fragment, end=False):
+            try:
+                while True:
+                    text_batches = chunker.push(fragment) + (chunker.flush() if end else [])
+                    for gen_text in text_batches:
+                        logger.info(f"Session {session.session_id}: streamed chunk: {gen_text}")
+                    for request in self.processor.make_requests(text_batches, session, speed=speed):
+                        # a slot per chunk until its audio is ready, not for the whole stream, as a client may
+                        # keep it open for long. waits while too many requests are pending
+                        await self.slots.acquire()
+                        (future,) = self.submit([request])
+                        future.add_done_callback(lambda _: self.slots.release())
+                        submitted.append(future)
+                        futures.put_nowait(future)
+                    if end:
+                        break
+                    frame_type, payload = await read_frame(reader, max_size=MAX_REQUEST_SIZE)
+                    if frame_type != FRAME_TEXT:
+                        raise ValueError(f"Expected a text frame, got type {frame_type}")
+                    fragment, end = decode_text(payload)
+            finally:
+                futures.put_nowait(None)  # audio of what was submitted is still sent
+
+        reading = asyncio.create_task(read_text(text))
+        try:
+            await self.send_audio(session, futures, send)
+            await reading  # raises a read error, after the audio of the text before it
+        finally:
+            reading.cancel()
+            self.scheduler.cancel(session.session_id)
+            for future in submitted:  # cancelled requests never complete, release their slots
+                future.cancel()
+
+    async def handle_client(self, reader, writer):
+        session = TTSSession(self.num_sessions, self.output_dir)
+        self.num_sessions += 1
+        logger.info(f"Session {session.session_id}: connected by {writer.get_extra_info('peername')}")
+        writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            data = await reader.read(1024)
+            # a read may return only part of the magic. its leading nul byte alone tells the protocol, as legacy
+            # text never starts with it, and read_frame() checks the whole magic through the prefixed reader
+            if data[:1] == MAGIC[:1]:
+                await self.handle_framed(session, PrefixedReader(data, reader), writer)
+            elif data:
+                await self.handle_legacy(session, data, reader, writer)
+        except Exception as e:
+            logger.error(f"Session {session.session_id}: error handling client: {e}")
+            traceback.print_exc()
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+            logger.info(f"Session {session.session_id}: closed")
+
+    async def handle_framed(self, session, reader, writer):
         while True:
-            conn, addr = s.accept()
-            logger.info(f"Connected by {addr}")
-            handle_client(conn, processor)
+            try:
+                frame_type, payload = await read_frame(reader, max_size=MAX_REQUEST_SIZE)
+            except asyncio.IncompleteReadError:
+                break
+            if frame_type != FRAME_REQUEST:
+                raise ValueError(f"Expected a request frame, got type {frame_type}")
+            text, voice, params = decode_request(payload)
+            sample_format = params.get("sample_format", "float32")
+            if voice not in (None, "default") or sample_format not in SAMPLE_FORMATS:
+                writer.write(encode_error(f"Unsupported voice {voice!r} or sample format {sample_format!r}"))
+                await writer.drain()
+                continue
+
+            seq = 0
+
+            async def send(audio_chunk, end=False):
+                nonlocal seq
+                writer.writelines(
+                    encode_audio(audio_chunk, self.processor.sampling_rate, seq, end=end, sample_format=sample_format)
+                )
+                seq += 1
+                await writer.drain()
+
+            try:
+                if params.get("stream"):
+                    await self.synthesize_stream(session, text, reader, send, speed=params.get("speed", 1))
+                else:
+                    await self.synthesize(session, text, send, speed=params.get("speed", 1))
+            except Exception as e:
+                writer.write(encode_error(str(e)))
+                await writer.drain()
+                raise
+            await send(np.zeros(0, dtype=np.float32), end=True)
+
+    async def handle_legacy(self, session, data, reader, writer):
+        # raw utf-8 text in, raw float32 samples then b"END" out, one request per read
+        async def send(audio_chunk):
+            writer.write(memoryview(np.ascontiguousarray(audio_chunk, dtype=np.float32)).cast("B"))
+            await writer.drain()
+
+        while data:
+            await self.synthesize(session, data.decode("utf-8").strip(), send)
+            writer.write(b"END")  # Send end signal
+            await writer.drain()
+            data = await reader.read(1024)
 
 
 if __name__ == "__main__":
@@ -223,8 +459,8 @@ if __name__ == "__main__":
     )
     parser.add_argument(
         "--ckpt_file",
-        default=str(hf_hub_download(repo_id="SWivid/F5-TTS", filename="F5TTS_v1_Base/model_1250000.safetensors")),
-        help="Path to the model checkpoint file",
+        default="",
+        help="Path to the model checkpoint file, default to F5TTS_v1_Base from the model registry or huggingface",
     )
     parser.add_argument(
         "--vocab_file",
@@ -240,28 +476,75 @@ if __name__ == "__main__":
     parser.add_argument(
         "--ref_text",
         default="",
-        help="Reference audio subtitle, leave empty to auto-transcribe",
+        help="Reference audio subtitle, leave empty to transcribe with whisper, from the model registry or huggingface",
     )
 
     parser.add_argument("--device", default=None, help="Device to run the model on")
-    parser.add_argument("--dtype", default=torch.float32, help="Data type to use for model inference")
+    parser.add_argument(
+        "--dtype",
+        default="float32",
+        choices=["float32", "float16", "bfloat16"],
+        help="Data type to use for model inference, bfloat16 runs autocast over fp32 weights",
+    )
+    parser.add_argument("--compile", action="store_true", help="Compile the transformer with frame bucketing")
+    parser.add_argument("--compile_cache_dir", default=None, help="Directory to keep compile artifacts across starts")
+
+    # cpu thread budget, when running several servers on one host
+    parser.add_argument("--num_workers", type=int, default=None, help="Number of server workers sharing the cores")
+    parser.add_argument("--worker_rank", type=int, default=0, help="Index of this worker, picks its core slice")
+    parser.add_argument("--cores", default=None, help="Cores to split across the workers, e.g. 0-15, default all")
+    parser.add_argument("--inter_op_threads", type=int, default=1, help="Inter-op threads per worker")
+    parser.add_argument("--pin_cores", action="store_true", help="Pin this worker to its core slice")
+
+    parser.add_argument("--max_queue_size", type=int, default=16, help="Pending requests before clients wait")
+    parser.add_argument(
+        "--scheduler",
+        default="batch",
+        choices=["batch", "continuous"],
+        help="Batch chunks per sample call, or admit them between ode steps (continuous, DiT only)",
+    )
+    parser.add_argument("--batch_window", type=float, default=0.02, help="Seconds to collect chunks into a batch")
+    parser.add_argument("--batch_frame_budget", type=int, default=16384, help="Max padded frames per batch")
+    parser.add_argument("--output_dir", default=None, help="Also save each session's audio as a wav file here")
 
     args = parser.parse_args()
+    if args.compile and args.scheduler == "continuous":
+        parser.error("--compile is not used by --scheduler continuous, it calls the transformer blocks directly")
+
+    if args.num_workers is not None:
+        setup_worker_threads(
+            args.num_workers,
+            args.worker_rank,
+            cores=parse_core_list(args.cores) if args.cores else None,
+            inter_op_threads=args.inter_op_threads,
+            pin_cores=args.pin_cores,
+        )
 
     try:
         # Initialize the processor with the model and vocoder
         processor = TTSStreamingProcessor(
             model=args.model,
-            ckpt_file=args.ckpt_file,
+            ckpt_file=args.ckpt_file
+            or resolve_model_file("hf://SWivid/F5-TTS/F5TTS_v1_Base/model_1250000.safetensors"),
             vocab_file=args.vocab_file,
             ref_audio=args.ref_audio,
             ref_text=args.ref_text,
             device=args.device,
             dtype=args.dtype,
+            compile=args.compile,
+            compile_cache_dir=args.compile_cache_dir,
         )
 
         # Start the server
-        start_server(args.host, args.port, processor)
+        server = TTSServer(
+            processor,
+            max_queue_size=args.max_queue_size,
+            output_dir=args.output_dir,
+            scheduler=args.scheduler,
+            batch_window=args.batch_window,
+            batch_frame_budget=args.batch_frame_budget,
+        )
+        asyncio.run(server.serve(args.host, args.port))
 
     except KeyboardInterrupt:
         gc.collect()